@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+'''
+Benchmark the Sensu report and purge scripts against sensu_mock_api
+
+Every script is run as its own process against a fresh synthetic fleet
+for each size, recording the wall time, the peak RSS of the script,
+the number of API requests it made and the bytes it downloaded. The
+runs are stored as JSON, and --compare prints the change against an
+earlier run. A run whose script exits nonzero is marked failed, left
+out of the means and the comparison, and makes the benchmark exit 1:
+
+    sensu_benchmark.py -o before.json
+    git checkout my-branch
+    sensu_benchmark.py -o after.json --compare before.json
+
+Several scripts are Python 2 only. Under Python 2 the scripts are run
+with the same interpreter unless --python is given, under Python 3
+--python is required.
+'''
+
+# Import Standard Modules
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+
+try:
+    from prettytable import PrettyTable
+except ImportError:
+    print("Please install prettytable:")
+    print("$ sudo pip install prettytable")
+    sys.exit(3)
+
+try:
+    from sensu_mock_api import Fleet, build_fleet, mock_server
+except ImportError:
+    print("Unable to import sensu_mock_api")
+    sys.exit(3)
+
+_LOGGER = logging.getLogger(__name__)
+
+SCRIPTS = [
+    'sensu_stale_report.py',
+    'sensu_no_ttl_report.py',
+    'sensu_dup_check_report.py',
+    'sensu_look_for_checks.py',
+    'sensu_look_for_checks2.py',
+    'sensu_look_for_ping_checks.py',
+    'sensu_missing_collectd_proc_check.py',
+    'sensu_delete_result.py',
+    'sensu_delete_result2.py',
+    'sensu_delete_dns_metrics.py',
+    'sensu_delete_ping_checks.py',
+    'sensu_delete_dns_locsrv_check_soa_comparison.py',
+    'sensu_delete_old_clients.py',
+]
+
+
+def run_script(python, script, url, extra_args):
+    # os.wait4 gives the resource usage of this one child, ru_maxrss is
+    # in kilobytes on Linux
+    devnull = open(os.devnull, 'wb')
+    try:
+        start = time.time()
+        process = subprocess.Popen(
+            [python, script, '-s', url] + extra_args,
+            stdout=devnull, stderr=devnull,
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.time() - start
+    finally:
+        devnull.close()
+    # Already reaped by wait4, keep Popen from waiting on it again
+    process.returncode = status
+    exit_code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+    return {
+        'wall': round(wall, 3),
+        'max_rss_kb': usage.ru_maxrss,
+        'exit_code': exit_code,
+        'failed': exit_code != 0,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scripts, sizes, python, checks=5, repeat=1,
+                   extra_args=(), seed=0):
+    runs = []
+    for size in sizes:
+        # Every client has a keepalive, `checks` checks and most of them
+        # Check_Collectd_Process
+        clients, results = build_fleet(
+            clients=max(1, int(size / (checks + 1.9))), checks=checks,
+            seed=seed)
+        _LOGGER.info("Fleet of %s clients and %s results" %
+                     (len(clients), len(results)))
+        server = mock_server(Fleet(clients, results))
+        url = "http://%s:%s" % server.server_address
+        try:
+            for script in scripts:
+                for _ in range(repeat):
+                    # Purges change the fleet, every run starts over
+                    server.fleet = Fleet(clients, results)
+                    for key in server.stats:
+                        server.stats[key] = 0
+                    run = run_script(python, script, url, list(extra_args))
+                    run.update({
+                        'script': script,
+                        'size': size,
+                        'results': len(results),
+                        'clients': len(clients),
+                        'requests': server.stats['requests'],
+                        'bytes': server.stats['bytes_sent'],
+                    })
+                    _LOGGER.info("%(script)s %(results)s results: "
+                                 "%(wall)ss %(max_rss_kb)skB "
+                                 "%(requests)s requests" % run)
+                    if run['failed']:
+                        _LOGGER.error("%s exited with %s, the run is "
+                                      "not counted" %
+                                      (script, run['exit_code']))
+                    runs.append(run)
+        finally:
+            server.shutdown()
+            server.server_close()
+    return runs
+
+
+def summarize(runs):
+    # Mean wall time and peak RSS per (script, size) over the repeats
+    # that succeeded, runs stored before 'failed' existed use exit_code
+    summary = {}
+    for run in runs:
+        if run.get('failed', run.get('exit_code')):
+            continue
+        key = (run['script'], run['size'])
+        entry = summary.setdefault(key, {'wall': 0.0, 'max_rss_kb': 0,
+                                         'count': 0})
+        entry['wall'] += run['wall']
+        entry['max_rss_kb'] = max(entry['max_rss_kb'], run['max_rss_kb'])
+        entry['count'] += 1
+    for entry in summary.values():
+        entry['wall'] /= entry['count']
+    return summary
+
+
+def change(old, new):
+    if not old:
+        return ''
+    return "%+.1f%%" % (100.0 * (new - old) / old)
+
+
+def compare(previous, current):
+    old = summarize(previous['runs'])
+    new = summarize(current['runs'])
+    table = PrettyTable(['Script', 'Size', 'Wall', 'Wall Change',
+                         'Peak RSS kB', 'RSS Change'])
+    for key in sorted(new):
+        script, size = key
+        before = old.get(key, {})
+        table.add_row([script, size, "%.3f" % new[key]['wall'],
+                       change(before.get('wall'), new[key]['wall']),
+                       new[key]['max_rss_kb'],
+                       change(before.get('max_rss_kb'),
+                              new[key]['max_rss_kb'])])
+    return table.get_string()
+
+
+# Gather our code in a main() function
+def main(args, loglevel):
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=loglevel)
+
+    scripts = SCRIPTS
+    if args.scripts:
+        scripts = [x.strip() for x in args.scripts.split(',')]
+    sizes = [int(x) for x in args.sizes.split(',')]
+    runs = run_benchmarks(scripts, sizes, args.python, checks=args.checks,
+                          repeat=args.repeat,
+                          extra_args=args.extra_args.split(),
+                          seed=args.seed)
+    current = {
+        'commit': git_commit(),
+        'timestamp': int(time.time()),
+        'python': args.python,
+        'platform': platform.platform(),
+        'runs': runs,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(current, f, indent=2, sort_keys=True)
+
+    table = PrettyTable(['Script', 'Results', 'Wall', 'Peak RSS kB',
+                         'Requests', 'Bytes', 'Exit'])
+    for run in runs:
+        table.add_row([run['script'], run['results'], run['wall'],
+                       run['max_rss_kb'], run['requests'], run['bytes'],
+                       run['exit_code']])
+    print(table)
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(json.load(f), current))
+    if any(run['failed'] for run in runs):
+        sys.exit(1)
+
+
+# Standard boilerplate to call the main() function to begin
+# the program.
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the Sensu scripts against a local stand-in "
+                    "for the Sensu API.",
+        epilog="Available scripts: %s" % ", ".join(SCRIPTS)
+    )
+    parser.add_argument(
+        "--scripts",
+        type=str,
+        required=False,
+        help="Comma separated scripts to run, defaults to all of them",
+        metavar="scripts"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=str,
+        required=False,
+        help="Comma separated fleet sizes in results",
+        metavar="sizes",
+        default="10000,100000,1000000"
+    )
+    parser.add_argument(
+        "--checks",
+        type=int,
+        required=False,
+        help="Checks per client in the synthetic fleet",
+        metavar="checks",
+        default=5
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        required=False,
+        help="Number of runs per script and size",
+        metavar="repeat",
+        default=1
+    )
+    # Not every script runs on Python 3
+    python2 = sys.version_info[0] < 3
+    parser.add_argument(
+        "--python",
+        type=str,
+        required=not python2,
+        help="Python 2 interpreter the scripts are run with, defaults to "
+             "this one when it is Python 2",
+        metavar="python",
+        default=sys.executable if python2 else None
+    )
+    parser.add_argument(
+        "--extra_args",
+        type=str,
+        required=False,
+        help="Extra arguments passed to every script, e.g. "
+             "--extra_args=\"--stream --page_size 1000\"",
+        metavar="extra_args",
+        default=""
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        required=False,
+        help="Random seed of the synthetic fleet",
+        metavar="seed",
+        default=0
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        required=False,
+        help="JSON file the runs are written to",
+        metavar="output",
+        default="sensu_benchmark.json"
+    )
+    parser.add_argument(
+        "--compare",
+        type=str,
+        required=False,
+        help="Earlier --output file to compare against",
+        metavar="previous"
+    )
+    loglevel_group = parser.add_mutually_exclusive_group(required=False)
+    loglevel_group.add_argument(
+        "-v",
+        "--verbose",
+        help="increase output verbosity",
+        action="count",
+        default=0)
+    loglevel_group.add_argument(
+        "-q",
+        "--quiet",
+        help="decrease output verbosity",
+        action="count",
+        default=0)
+    args = parser.parse_args()
+
+    # Setup logging
+    # script -vv -> DEBUG
+    # script -v -> INFO
+    # script -> WARNING
+    # script -q -> ERROR
+    # script -qq -> CRITICAL
+    # script -qqq -> no logging at all
+    loglevel = logging.WARNING + 10*args.quiet - 10*args.verbose
+    # Set 'max'/'min' levels for logging
+    if loglevel > 50:
+        loglevel = 50
+    elif loglevel < 10:
+        loglevel = 10
+
+    main(args, loglevel)
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+'''
+Inverted index of which Sensu clients run which checks
+
+Built in one pass over /results and /clients, the index maps
+
+    check template -> clients   (CPU_Metrics_on_<client>, keepalive)
+    client         -> check templates
+    subscription   -> clients
+
+and is saved to disk, so repeated "who still runs X" questions are
+answered from the file until it is older than --index_ttl:
+
+    sensu_check_index.py -s sensu1 -p 'CPU_Metrics*' -p Check_Ping4_<client>
+    sensu_check_index.py -s sensu1 --subscription base --client web01
+
+Patterns are template names or shell globs over them. Exact names are
+dictionary lookups, a glob scans the distinct templates once, never
+the results.
+'''
+
+# Import Standard Modules
+import argparse
+import fnmatch
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+
+try:
+    from sensu_functions import (add_api_arguments,
+                                 atomic_write,
+                                 fetch_clients,
+                                 fetch_results,
+                                 sensu_api,
+                                 sensu_host_fan_out)
+except ImportError:
+    print("Unable to import sensu_functions")
+    sys.exit(3)
+
+try:
+    from sensu_matchers import CLIENT, SEPARATORS, CheckMatcher
+except ImportError:
+    print("Unable to import sensu_matchers")
+    sys.exit(3)
+
+try:
+    from sensu_output import add_output_arguments, row_writer
+except ImportError:
+    print("Unable to import sensu_output")
+    sys.exit(3)
+
+_LOGGER = logging.getLogger(__name__)
+
+GLOB_CHARS = frozenset('*?[')
+
+
+class CheckIndex(object):
+
+    version = 2
+
+    def __init__(self, sensu_hosts=(), built=None):
+        self.sensu_hosts = sorted(sensu_hosts)
+        self.built = built or time.time()
+        self.templates = {}
+        self.subscriptions = {}
+        self._checks = None
+        self._splitter = CheckMatcher()
+
+    def add_result(self, client, check_name):
+        template = self._splitter.template(client, check_name)
+        clients = self.templates.get(template)
+        if clients is None:
+            clients = self.templates[template] = set()
+        clients.add(client)
+        self._checks = None
+
+    def add_client(self, client):
+        for subscription in client.get('subscriptions') or ():
+            self.subscriptions.setdefault(subscription, set()).add(
+                client['name'])
+
+    @property
+    def checks(self):
+        # client -> templates, inverted from the template map on first use
+        if self._checks is None:
+            checks = {}
+            for template, clients in self.templates.items():
+                for client in clients:
+                    checks.setdefault(client, set()).add(template)
+            self._checks = checks
+        return self._checks
+
+    def templates_matching(self, pattern):
+        if not GLOB_CHARS.intersection(pattern):
+            return [pattern] if pattern in self.templates else []
+        return [x for x in self.templates if fnmatch.fnmatchcase(x, pattern)]
+
+    def clients_running(self, pattern):
+        clients = set()
+        for template in self.templates_matching(pattern):
+            clients.update(self.templates[template])
+        return clients
+
+    def find(self, names=(), prefixes=()):
+        '''
+        The clients a CheckMatcher with these names and per-client
+        prefixes would select
+        '''
+        clients = set()
+        for prefix in prefixes:
+            if prefix[-1:] in SEPARATORS:
+                clients.update(self.templates.get(prefix + CLIENT, ()))
+                continue
+            # Not a template prefix, its checks were indexed by name
+            for client in self.checks:
+                if client in self.templates.get(prefix + client, ()):
+                    clients.add(client)
+        for name in names:
+            clients.update(self.templates.get(name, ()))
+            # A per-client name was folded into its template, try the
+            # template of every separator in the name
+            for i, char in enumerate(name):
+                if char in SEPARATORS:
+                    template = self.templates.get(name[:i + 1] + CLIENT)
+                    if template and name[i + 1:] in template:
+                        clients.add(name[i + 1:])
+        return clients
+
+    def to_dict(self):
+        return {
+            'version': self.version,
+            'sensu_hosts': self.sensu_hosts,
+            'built': self.built,
+            'templates': dict((k, sorted(v))
+                              for k, v in self.templates.items()),
+            'subscriptions': dict((k, sorted(v))
+                                  for k, v in self.subscriptions.items()),
+        }
+
+    @classmethod
+    def from_dict(cls, values):
+        if values.get('version') != cls.version:
+            raise ValueError("unsupported index version %r" %
+                             values.get('version'))
+        index = cls(values['sensu_hosts'], values['built'])
+        index.templates = dict((k, set(v))
+                               for k, v in values['templates'].items())
+        index.subscriptions = dict(
+            (k, set(v)) for k, v in values['subscriptions'].items())
+        return index
+
+    def save(self, path):
+        with atomic_write(path, compress=True) as f:
+            f.write(json.dumps(self.to_dict()).encode('utf-8'))
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, 'rb') as f:
+            return cls.from_dict(json.loads(f.read().decode('utf-8')))
+
+
+def build_index(api, sensu_hosts, args):
+    '''
+    Returns the index of sensu_hosts and the hosts that failed
+    '''
+    index = CheckIndex(sensu_hosts)
+    clients = sensu_host_fan_out(api, sensu_hosts, fetch_clients, args)
+    for _, values in clients:
+        for client in values:
+            index.add_client(client)
+    results = sensu_host_fan_out(api, sensu_hosts, fetch_results, args)
+    for _, values in results:
+        for result in values:
+            index.add_result(result['client'], result['check']['name'])
+    return index, clients.failed + results.failed
+
+
+def sensu_check_index(api, sensu_hosts, args):
+    '''
+    Loads the index saved at --index when it covers sensu_hosts and is
+    younger than --index_ttl, builds and saves a new one otherwise.
+    Returns the index and the hosts that failed.
+    '''
+    path = os.path.expanduser(args.index)
+    if not args.rebuild_index:
+        try:
+            index = CheckIndex.load(path)
+            age = time.time() - index.built
+            if (index.sensu_hosts == sorted(sensu_hosts) and
+                    0 <= age < args.index_ttl):
+                _LOGGER.info("Using %s, built %ds ago" % (path, age))
+                return index, []
+        except (IOError, OSError, ValueError, KeyError) as e:
+            _LOGGER.info("No usable index in %s: %s" % (path, e))
+    index, failed = build_index(api, sensu_hosts, args)
+    if failed:
+        _LOGGER.warning("Not every Sensu host answered, the index is not "
+                        "saved")
+    else:
+        index.save(path)
+    return index, failed
+
+
+def add_index_arguments(parser, default=None):
+    parser.add_argument(
+        "--index",
+        type=str,
+        required=False,
+        help="Answer from the check index saved in this file, building "
+             "it when missing or stale",
+        metavar="index",
+        default=default
+    )
+    parser.add_argument(
+        "--index_ttl",
+        type=int,
+        required=False,
+        help="Seconds a saved index is used before it is rebuilt",
+        metavar="index_ttl",
+        default=3600
+    )
+    parser.add_argument(
+        "--rebuild_index",
+        help="rebuild the index even when the saved one is fresh",
+        action="store_true",
+        default=False
+    )
+
+
+# Gather our code in a main() function
+def main(args, loglevel):
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=loglevel)
+
+    sensu_hosts = [x.strip() for x in args.sensu_hosts.split(',')]
+    api = sensu_api(args)
+
+    index, failed = sensu_check_index(api, sensu_hosts, args)
+    rows = []
+    for pattern in args.patterns or []:
+        for client in sorted(index.clients_running(pattern)):
+            rows.append(['check', pattern, client])
+    for subscription in args.subscriptions or []:
+        for client in sorted(index.subscriptions.get(subscription, ())):
+            rows.append(['subscription', subscription, client])
+    for client in args.clients or []:
+        for template in sorted(index.checks.get(client, ())):
+            rows.append(['client', client, template])
+    fields = ['Query', 'Pattern', 'Match']
+    writer = row_writer(args.format, fields)
+    if writer is None:
+        from prettytable import PrettyTable
+        table = PrettyTable(fields)
+        for row in rows:
+            table.add_row(row)
+        print(table)
+    else:
+        for row in rows:
+            writer.row(row)
+        writer.close()
+    api.log_stats()
+    if failed:
+        sys.exit(1)
+
+
+# Standard boilerplate to call the main() function to begin
+# the program.
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description="Answers which Sensu clients run which checks from an "
+                    "inverted index saved on disk.",
+        epilog="Patterns are check templates such as "
+               "CPU_Metrics_on_<client>, or shell globs over them"
+    )
+    parser.add_argument(
+        "-s",
+        "--sensu_hosts",
+        type=str,
+        required=True,
+        help="Sensu Host",
+        metavar="sensu_host"
+    )
+    parser.add_argument(
+        "-p",
+        "--pattern",
+        dest="patterns",
+        action="append",
+        help="List the clients running checks matching this pattern, "
+             "may be given several times",
+        metavar="pattern"
+    )
+    parser.add_argument(
+        "--subscription",
+        dest="subscriptions",
+        action="append",
+        help="List the clients with this subscription, may be given "
+             "several times",
+        metavar="subscription"
+    )
+    parser.add_argument(
+        "--client",
+        dest="clients",
+        action="append",
+        help="List the checks of this client, may be given several times",
+        metavar="client"
+    )
+    add_index_arguments(parser, default="~/.cache/sensu_check_index.json.gz")
+    add_output_arguments(parser)
+    add_api_arguments(parser)
+    loglevel_group = parser.add_mutually_exclusive_group(required=False)
+    loglevel_group.add_argument(
+        "-v",
+        "--verbose",
+        help="increase output verbosity",
+        action="count",
+        default=0)
+    loglevel_group.add_argument(
+        "-q",
+        "--quiet",
+        help="decrease output verbosity",
+        action="count",
+        default=0)
+    args = parser.parse_args()
+
+    # Setup logging
+    # script -vv -> DEBUG
+    # script -v -> INFO
+    # script -> WARNING
+    # script -q -> ERROR
+    # script -qq -> CRITICAL
+    # script -qqq -> no logging at all
+    loglevel = logging.WARNING + 10*args.quiet - 10*args.verbose
+    # Set 'max'/'min' levels for logging
+    if loglevel > 50:
+        loglevel = 50
+    elif loglevel < 10:
+        loglevel = 10
+
+    main(args, loglevel)
@@ -7,13 +7,28 @@ Add some documentation here
 import argparse
 import logging
 import sys
-import json
 
 try:
-    import requests
+    from sensu_functions import (add_api_arguments,
+                                 fetch_clients,
+                                 sensu_api,
+                                 sensu_host_fan_out)
 except ImportError:
-    print "Please install requests"
-    print "$ sudo pip install request"
+    print "Unable to import sensu_functions"
+    sys.exit(3)
+
+try:
+    from sensu_reports import ClientListReport, finish_reports
+except ImportError:
+    print "Unable to import sensu_reports"
+    sys.exit(3)
+
+try:
+    from sensu_delta import (add_delta_arguments,
+                             partial_deltas,
+                             stream_deltas)
+except ImportError:
+    print "Unable to import sensu_delta"
     sys.exit(3)
 
 try:
@@ -24,29 +39,34 @@ except ImportError:
     sys.exit(3)
 
 
-def sensu_results(sensu_host):
-    url = "https://%s/clients" % sensu_host
-    try:
-        r = requests.get(url, timeout=5.0, verify=False)
-        return r.text
-    except requests.exceptions.RequestException as e:
-        print e
-        sys.exit(1)
-
-
 # Gather our code in a main() function
 def main(args, loglevel):
     logging.basicConfig(format="%(levelname)s: %(message)s", level=loglevel)
 
     sensu_hosts = [x.strip() for x in args.sensu_hosts.split(',')]
+    api = sensu_api(args)
+
+    if args.delta:
+        # Only the clients that registered or went away since the
+        # previous --delta run
+        report = ClientListReport()
+        stream_deltas([report], 'table', args.state_dir, sensu_hosts)
+        hosts = sensu_host_fan_out(api, sensu_hosts, fetch_clients, args)
+        for sensu_host, values in hosts:
+            for index in values:
+                report.add(sensu_host, index)
+        if hosts.failed:
+            partial_deltas([report])
+        finish_reports([report])
+        api.log_stats()
+        if hosts.failed:
+            sys.exit(1)
+        return
 
     all_sensu_clients = []
     total_count = 0
-    for sensu_host in sensu_hosts:
-        r = sensu_results(sensu_host)
-
-        values = json.loads(r)
-
+    hosts = sensu_host_fan_out(api, sensu_hosts, fetch_clients, args)
+    for sensu_host, values in hosts:
         for index in values:
             client = index['name']
             total_count += 1
@@ -55,6 +75,9 @@ def main(args, loglevel):
     for client in all_sensu_clients:
         print("%s,") % (client)
     print("Total Client Count: %s") % (total_count)
+    api.log_stats()
+    if hosts.failed:
+        sys.exit(1)
 
 
 # Standard boilerplate to call the main() function to begin
@@ -74,6 +97,8 @@ if __name__ == '__main__':
         help="Sensu Host",
         metavar="sensu_host"
     )
+    add_delta_arguments(parser)
+    add_api_arguments(parser)
     loglevel_group = parser.add_mutually_exclusive_group(required=False)
     loglevel_group.add_argument(
         "-v",
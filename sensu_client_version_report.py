@@ -7,32 +7,31 @@ Add some documentation here
 import argparse
 import logging
 import sys
-import json
 import operator
 
 try:
-    import requests
+    from sensu_functions import (add_api_arguments,
+                                 fetch_clients,
+                                 positive_int,
+                                 sensu_api,
+                                 sensu_host_fan_out)
 except ImportError:
-    print "Please install requests"
-    print "$ sudo pip install request"
+    print "Unable to import sensu_functions"
     sys.exit(3)
 
 try:
-    from prettytable import PrettyTable
+    from sensu_reports import (ClientVersionReport,
+                               finish_reports,
+                               stream_reports)
 except ImportError:
-    print "Please install prettytable:"
-    print "$ sudo pip install prettytable"
+    print "Unable to import sensu_reports"
     sys.exit(3)
 
-
-def sensu_results(sensu_host):
-    url = "https://%s/clients" % sensu_host
-    try:
-        r = requests.get(url, timeout=5.0, verify=False)
-        return r.text
-    except requests.exceptions.RequestException as e:
-        print e
-        sys.exit(1)
+try:
+    from sensu_output import add_output_arguments
+except ImportError:
+    print "Unable to import sensu_output"
+    sys.exit(3)
 
 
 # Gather our code in a main() function
@@ -40,25 +39,23 @@ def main(args, loglevel):
     logging.basicConfig(format="%(levelname)s: %(message)s", level=loglevel)
 
     sensu_hosts = [x.strip() for x in args.sensu_hosts.split(',')]
+    api = sensu_api(args)
 
-    total_count = 0
-    table = PrettyTable(['Client', 'Version'])
-    for sensu_host in sensu_hosts:
-        r = sensu_results(sensu_host)
-
-        values = json.loads(r)
-
+    report = ClientVersionReport(aggregate=args.aggregate,
+                                 target_version=args.target_version,
+                                 batch_size=args.batch_size)
+    stream_reports([report], args.format)
+    hosts = sensu_host_fan_out(api, sensu_hosts, fetch_clients, args)
+    for sensu_host, values in hosts:
         for index in values:
-            client = index['name']
-            version = index['version']
-            #if '0.26.5' in version:
-            total_count += 1
-            table.add_row([
-                client,
-                version,
-            ])
-    print table.get_string(sortby="Version")
-    print(total_count)
+            report.add(sensu_host, index)
+    if report.writer is None:
+        print report.render()
+    finish_reports([report])
+    api.log_stats()
+    if hosts.failed:
+        sys.exit(1)
+
 
 # Standard boilerplate to call the main() function to begin
 # the program.
@@ -77,6 +74,33 @@ if __name__ == '__main__':
         help="Sensu Host",
         metavar="sensu_host"
     )
+    parser.add_argument(
+        "-a",
+        "--aggregate",
+        help="only count clients per version and Sensu host and print a "
+             "histogram instead of listing every client",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "-t",
+        "--target_version",
+        "--target-version",
+        type=str,
+        required=False,
+        help="Only include clients running a version older than this one",
+        metavar="target_version"
+    )
+    parser.add_argument(
+        "-b",
+        "--batch_size",
+        type=positive_int,
+        required=False,
+        help="Split the listed clients into upgrade batches of this size",
+        metavar="batch_size"
+    )
+    add_output_arguments(parser)
+    add_api_arguments(parser)
     loglevel_group = parser.add_mutually_exclusive_group(required=False)
     loglevel_group.add_argument(
         "-v",
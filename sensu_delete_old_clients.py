@@ -11,18 +11,22 @@ are deleted
 import argparse
 import logging
 import sys
-import json
 import re
+import threading
+import time
 from datetime import datetime
 
 
 try:
-    import requests
-    from requests.packages.urllib3.exceptions import InsecureRequestWarning
-    requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+    from sensu_functions import (add_api_arguments,
+                                 add_delete_arguments,
+                                 fetch_clients,
+                                 fetch_results,
+                                 sensu_api,
+                                 sensu_bulk_delete,
+                                 sensu_host_fan_out)
 except ImportError:
-    print("Please install requests")
-    print("$ sudo pip install request")
+    print("Unable to import sensu_functions")
     sys.exit(3)
 
 
@@ -35,24 +39,33 @@ Valid format is YYYY-MM-DD".format(s)
         raise argparse.ArgumentTypeError(msg)
 
 
-def sensu_results(sensu_host):
-    url = "https://%s/clients" % sensu_host
-    try:
-        r = requests.get(url, timeout=5.0, verify=False)
-        return r.text
-    except requests.exceptions.RequestException as e:
-        print e
-        sys.exit(1)
+def date_cutoff(date):
+    # Epoch of local midnight starting `date`. A client is old when the
+    # calendar day it was last seen is before the cutoff day, the same
+    # as fromtimestamp(timestamp).date() < date.date()
+    return time.mktime(date.date().timetuple())
 
 
-def sensu_delete_client(sensu_host, sensu_client):
-    url = "https://%s/clients/%s" % (sensu_host, sensu_client)
-    try:
-        r = requests.delete(url, timeout=5.0, verify=False)
-        return r
-    except requests.exceptions.RequestException as e:
-        print(e)
-        sys.exit(1)
+def old_clients(clients, cutoff, pattern):
+    for client in clients:
+        if client['timestamp'] < cutoff and pattern.search(client['name']):
+            yield client['name']
+
+
+class DeletedClients(object):
+    # Collects the clients the delete workers removed, per Sensu host
+
+    def __init__(self):
+        self.clients = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, sensu_host, path):
+        with self._lock:
+            self.clients.setdefault(sensu_host, set()).add(
+                path[len("/clients/"):])
+
+    def __len__(self):
+        return sum(len(x) for x in self.clients.values())
 
 
 # Gather our code in a main() function
@@ -60,24 +73,44 @@ def main(args, loglevel):
     logging.basicConfig(format="%(levelname)s: %(message)s", level=loglevel)
 
     sensu_hosts = [x.strip() for x in args.sensu_hosts.split(',')]
-
-    for sensu_host in sensu_hosts:
-        r = sensu_results(sensu_host)
-
-        values = json.loads(r)
-        pattern = re.compile(args.comp_string)
-
+    api = sensu_api(args)
+
+    pattern = re.compile(args.comp_string)
+    cutoff = date_cutoff(args.comp_date)
+    deleted = DeletedClients()
+    deleter = sensu_bulk_delete(api, args, done=deleted)
+    hosts = sensu_host_fan_out(api, sensu_hosts, fetch_clients, args)
+    for sensu_host, values in hosts:
         if loglevel < 30:
             print("Clients Deleted")
-        for index in values:
-            client = index['name']
-            time = datetime.fromtimestamp(index['timestamp'])
-            if pattern.search(client):
-                # Check if client timestamp is smaller (older)
-                if time.date() < args.comp_date.date():
-                    sensu_delete_client(sensu_host, client)
-                    if loglevel < 30:
-                        print(client)
+        for client in old_clients(values, cutoff, pattern):
+            deleter.delete_client(sensu_host, client)
+            if loglevel < 30:
+                print(client)
+    deleter.close()
+    print("Clients: %s" % deleter.report())
+    failed = hosts.failed + deleter.failed
+
+    if args.cascade and len(deleted):
+        # One /results download per Sensu host, joined on the clients
+        # that are actually gone
+        result_deleter = sensu_bulk_delete(api, args)
+        results = sensu_host_fan_out(api, [x for x in sensu_hosts
+                                           if x in deleted.clients],
+                                     fetch_results, args)
+        for sensu_host, values in results:
+            clients = deleted.clients[sensu_host]
+            for result in values:
+                if result['client'] in clients:
+                    result_deleter.delete_result(sensu_host,
+                                                 result['client'],
+                                                 result['check']['name'])
+        result_deleter.close()
+        print("Results: %s" % result_deleter.report())
+        failed += results.failed + result_deleter.failed
+    api.log_stats()
+    if failed:
+        sys.exit(1)
 
 
 # Standard boilerplate to call the main() function to begin
@@ -117,6 +150,14 @@ if __name__ == '__main__':
         metavar="comp_string",
         default='.*'
     )
+    parser.add_argument(
+        "--cascade",
+        help="also delete the results of the deleted clients",
+        action="store_true",
+        default=False
+    )
+    add_api_arguments(parser)
+    add_delete_arguments(parser)
     loglevel_group = parser.add_mutually_exclusive_group(required=False)
     loglevel_group.add_argument(
         "-v",
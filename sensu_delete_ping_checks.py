@@ -8,34 +8,23 @@ ARIN Ansible Base Playbook
 import argparse
 import logging
 import sys
-import json
 
 try:
-    import requests
+    from sensu_functions import (add_api_arguments,
+                                 add_delete_arguments,
+                                 fetch_results,
+                                 sensu_api,
+                                 sensu_bulk_delete,
+                                 sensu_host_fan_out)
 except ImportError:
-    print("Please install requests")
-    print("$ sudo pip install request")
+    print("Unable to import sensu_functions")
     sys.exit(3)
 
-
-def sensu_results(sensu_host):
-    url = "https://%s/results" % sensu_host
-    try:
-        r = requests.get(url, timeout=5.0, verify=False)
-        return r.text
-    except requests.exceptions.RequestException as e:
-        print(e)
-        sys.exit(1)
-
-
-def sensu_delete_results(sensu_host, sensu_client, sensu_check):
-    url = "https://%s/results/%s/%s" % (sensu_host, sensu_client, sensu_check)
-    try:
-        r = requests.delete(url, timeout=5.0, verify=False)
-        return r.text
-    except requests.exceptions.RequestException as e:
-        print(e)
-        sys.exit(1)
+try:
+    from sensu_matchers import CheckMatcher
+except ImportError:
+    print("Unable to import sensu_matchers")
+    sys.exit(3)
 
 
 # Gather our code in a main() function
@@ -43,25 +32,29 @@ def main(args, loglevel):
     logging.basicConfig(format="%(levelname)s: %(message)s", level=loglevel)
 
     sensu_hosts = [x.strip() for x in args.sensu_hosts.split(',')]
-
-    for sensu_host in sensu_hosts:
-        r = sensu_results(sensu_host)
-
-        values = json.loads(r)
-
+    api = sensu_api(args)
+    deleter = sensu_bulk_delete(api, args)
+
+    purge_metrics = [
+        'Check_Ping6_',
+        'Check_Ping4_',
+        'check_ping4_',
+        'check_ping6_',
+    ]
+    matcher = CheckMatcher(prefixes=purge_metrics)
+
+    hosts = sensu_host_fan_out(api, sensu_hosts, fetch_results, args)
+    for sensu_host, values in hosts:
         for index in values:
-            purge_metrics = [
-                'Check_Ping6_',
-                'Check_Ping4_',
-                'check_ping4_',
-                'check_ping6_',
-            ]
             client = index['client']
             check_name = index['check']['name']
-            for index, item in enumerate(purge_metrics):
-                purge_metrics[index] = item + client
-            if check_name in purge_metrics:
-                sensu_delete_results(sensu_host, client, check_name)
+            if matcher.match(client, check_name):
+                deleter.delete_result(sensu_host, client, check_name)
+    deleter.close()
+    print(deleter.report())
+    api.log_stats()
+    if hosts.failed or deleter.failed:
+        sys.exit(1)
 
 
 # Standard boilerplate to call the main() function to begin
@@ -81,6 +74,8 @@ if __name__ == '__main__':
         help="Sensu Host",
         metavar="sensu_host"
     )
+    add_api_arguments(parser)
+    add_delete_arguments(parser)
     loglevel_group = parser.add_mutually_exclusive_group(required=False)
     loglevel_group.add_argument(
         "-v",
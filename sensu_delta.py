@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+'''
+Delta mode for the Sensu reports
+
+The rows of the previous run are kept as a fingerprint, one 32 bit
+hash per row keyed by the row's client (and check name for per-check
+reports). The next run only prints the rows that were added, removed
+or changed since then. Each row is looked up once in the previous
+fingerprint, so diffing is a linear hash join. The keys are kept in
+full so removed rows can be printed, the other columns only as the
+hash, and the state is gzip compressed. Columns a report declares as
+volatile, like the missed intervals of a stale check that grow with
+the clock, are left out of the hash.
+'''
+
+# Import Standard Modules
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import zlib
+
+try:
+    from sensu_functions import atomic_write
+except ImportError:
+    print("Unable to import sensu_functions")
+    sys.exit(3)
+
+try:
+    from sensu_output import TableWriter, row_writer
+except ImportError:
+    print("Unable to import sensu_output")
+    sys.exit(3)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def fingerprint(values):
+    return zlib.crc32(json.dumps(list(values)).encode('utf-8')) & 0xffffffff
+
+
+class DeltaState(object):
+    '''
+    The fingerprint of one report's previous run, stored as gzip
+    compressed JSON mapping the row key to the row hash
+    '''
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with gzip.open(self.path, 'rb') as f:
+                return json.loads(f.read().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            _LOGGER.info("No previous state in %s, every row is new"
+                         % self.path)
+            return {}
+
+    def save(self, rows):
+        # An interrupted run never leaves a truncated state behind
+        with atomic_write(self.path, compress=True) as f:
+            f.write(json.dumps(rows).encode('utf-8'))
+
+
+class DeltaWriter(object):
+    '''
+    Wraps a row writer and only passes on rows that differ from the
+    previous run, prefixed with a Change column. Removed rows are
+    written by close(), which also saves the new fingerprint. Changes
+    to the `volatile` fields alone do not count.
+    '''
+
+    def __init__(self, writer, state, key_size, fields, volatile=()):
+        self.writer = writer
+        self.state = state
+        self.key_size = key_size
+        self.width = len(fields)
+        self.stable = [i for i, x in enumerate(fields) if x not in volatile]
+        self.previous = state.load()
+        self.current = {}
+        # Set when a host failed, its rows would all look removed
+        self.partial = False
+
+    def key(self, values):
+        return '\t'.join('%s' % x for x in values[:self.key_size])
+
+    def row(self, values):
+        key = self.key(values)
+        digest = fingerprint(values[i] for i in self.stable)
+        self.current[key] = digest
+        previous = self.previous.get(key)
+        if previous is None:
+            self.writer.row(['added'] + list(values))
+        elif previous != digest:
+            self.writer.row(['changed'] + list(values))
+
+    def close(self):
+        if self.partial:
+            _LOGGER.warning("Not every Sensu host answered, removed rows "
+                            "are not reported and the state is kept")
+        else:
+            padding = [''] * (self.width - self.key_size)
+            for key in self.previous:
+                if key not in self.current:
+                    self.writer.row(['removed'] + key.split('\t') + padding)
+            self.state.save(self.current)
+        self.writer.close()
+
+
+def state_path(state_dir, report, sensu_hosts):
+    # One state per report and set of Sensu hosts
+    digest = hashlib.md5(json.dumps(
+        [sorted(sensu_hosts), report.fields]).encode('utf-8')).hexdigest()
+    return os.path.join(os.path.expanduser(state_dir),
+                        "%s-%s.json.gz" % (report.name, digest[:12]))
+
+
+def stream_deltas(reports, fmt, state_dir, sensu_hosts, label=False):
+    # Like stream_reports, the table format is buffered by a TableWriter
+    for report in reports:
+        fields = ['Change'] + report.fields
+        writer = row_writer(fmt, fields, label=report.name if label else None)
+        if writer is None:
+            writer = TableWriter(fields,
+                                 title="%s:" % report.name if label else None)
+        state = DeltaState(state_path(state_dir, report, sensu_hosts))
+        report.stream_to(DeltaWriter(writer, state, len(report.key_fields),
+                                     report.fields, report.volatile_fields))
+
+
+def partial_deltas(reports):
+    for report in reports:
+        if isinstance(report.writer, DeltaWriter):
+            report.writer.partial = True
+
+
+def add_delta_arguments(parser):
+    parser.add_argument(
+        "--delta",
+        help="only print the rows added, removed or changed since the "
+             "previous --delta run",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "--state_dir",
+        type=str,
+        required=False,
+        help="Directory the --delta fingerprints are kept in",
+        metavar="state_dir",
+        default="~/.cache/sensu_delta"
+    )
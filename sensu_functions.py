@@ -0,0 +1,773 @@
+#!/usr/bin/env python
+'''
+Functions used by the Sensu API scripts
+
+Every request goes through a single keep-alive requests.Session so a
+run pays for one TCP+TLS handshake per Sensu host instead of one per
+request.
+'''
+
+# Import Standard Modules
+import argparse
+import codecs
+import contextlib
+import gzip
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from requests.packages.urllib3.exceptions import InsecureRequestWarning
+    requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+except ImportError:
+    print("Please install requests")
+    print("$ sudo pip install request")
+    sys.exit(3)
+
+# Create global logger
+_LOGGER = logging.getLogger(__name__)
+
+# Separators allowed between the objects of a JSON array
+_ARRAY_SKIP = re.compile(r'[\s,]*')
+# Characters that can continue a number
+_NUMBER_TAIL = re.compile(r'[\d.eE+-]*')
+
+
+def iter_json_array(chunks):
+    '''
+    Decode the members of a top level JSON array one at a time from an
+    iterable of text chunks, so only the object being decoded is held in
+    memory rather than the whole document.
+    '''
+    decoder = json.JSONDecoder()
+    buf = ''
+    started = False
+    for chunk in chunks:
+        buf += chunk
+        pos = _ARRAY_SKIP.match(buf).end()
+        if not started:
+            if pos == len(buf):
+                continue
+            if buf[pos] != '[':
+                raise ValueError("Expected a JSON array")
+            started = True
+            pos = _ARRAY_SKIP.match(buf, pos + 1).end()
+        while pos < len(buf):
+            if buf[pos] == ']':
+                return
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # The object continues in the next chunk
+                break
+            if _NUMBER_TAIL.match(buf, end).end() == len(buf):
+                # A number could still continue in the next chunk, one
+                # cut after "1." or "1e" decodes as a shorter number
+                break
+            yield value
+            pos = _ARRAY_SKIP.match(buf, end).end()
+        buf = buf[pos:]
+    if started or buf.strip():
+        raise ValueError("Truncated JSON array")
+
+
+def iter_decoded(chunks):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in chunks:
+        yield decoder.decode(chunk)
+
+
+@contextlib.contextmanager
+def atomic_write(path, compress=False):
+    '''
+    Yields a binary file, gzip compressed with `compress`, that is
+    written next to `path` and only renamed over it once the block
+    finished, so readers never see a partial file. The temporary file
+    is removed when the block raises or a generator around it is
+    closed early.
+    '''
+    directory = os.path.dirname(path) or '.'
+    try:
+        os.makedirs(directory)
+    except OSError:
+        if not os.path.isdir(directory):
+            raise
+    fd, tmp_path = tempfile.mkstemp(dir=directory,
+                                    prefix='.%s.' % os.path.basename(path))
+    complete = False
+    try:
+        with os.fdopen(fd, 'wb') as raw:
+            if compress:
+                with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                    yield f
+            else:
+                yield raw
+        os.rename(tmp_path, path)
+        complete = True
+    finally:
+        if not complete:
+            os.remove(tmp_path)
+
+
+class SnapshotCache(object):
+    '''
+    Gzip compressed snapshots of Sensu API collections keyed by host
+    and endpoint, so scripts run back to back can share one download
+    '''
+
+    def __init__(self, directory, ttl, refresh=False, chunk_size=65536):
+        self.directory = os.path.expanduser(directory)
+        self.ttl = ttl
+        self.refresh = refresh
+        self.chunk_size = chunk_size
+
+    def path(self, sensu_host, endpoint):
+        name = re.sub(r'[^\w.-]+', '_', "%s%s" % (sensu_host, endpoint))
+        return os.path.join(self.directory, "%s.json.gz" % name)
+
+    def fresh(self, sensu_host, endpoint):
+        if self.refresh:
+            return False
+        try:
+            age = time.time() - os.path.getmtime(self.path(sensu_host,
+                                                           endpoint))
+        except OSError:
+            return False
+        return age < self.ttl
+
+    def load(self, sensu_host, endpoint):
+        _LOGGER.debug("Using snapshot %s" % self.path(sensu_host, endpoint))
+        with gzip.open(self.path(sensu_host, endpoint), 'rb') as f:
+            chunks = iter(lambda: f.read(self.chunk_size), b'')
+            for value in iter_json_array(iter_decoded(chunks)):
+                yield value
+
+    def store(self, sensu_host, endpoint, values):
+        # Write each value through as it is read, the snapshot only
+        # replaces the old one once the whole collection was read
+        with atomic_write(self.path(sensu_host, endpoint),
+                          compress=True) as f:
+            separator = b'['
+            for value in values:
+                f.write(separator)
+                f.write(json.dumps(value).encode('utf-8'))
+                separator = b','
+                yield value
+            f.write(b'[]' if separator == b'[' else b']')
+
+class SensuAPI(object):
+
+    def __init__(self, timeout=5.0, verify=False, pool_connections=10,
+                 pool_maxsize=10, scheme='https', stream=False,
+                 chunk_size=65536, page_size=0, prefetch=False,
+                 page_retries=3, cache=None):
+        self.timeout = timeout
+        self.scheme = scheme
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self.page_retries = page_retries
+        self.cache = cache
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self.adapter = HTTPAdapter(pool_connections=pool_connections,
+                                   pool_maxsize=pool_maxsize)
+        self.session = requests.Session()
+        self.session.verify = verify
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+    def url(self, sensu_host, path):
+        # Allow hosts given as full URLs, e.g. http://localhost:4567
+        if '://' in sensu_host:
+            return "%s%s" % (sensu_host.rstrip('/'), path)
+        return "%s://%s%s" % (self.scheme, sensu_host, path)
+
+    def request(self, method, sensu_host, path, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        with self._lock:
+            self.request_count += 1
+        return self.session.request(method, self.url(sensu_host, path),
+                                    **kwargs)
+
+    def get(self, sensu_host, path, **kwargs):
+        return self.request('GET', sensu_host, path, **kwargs)
+
+    def delete(self, sensu_host, path, **kwargs):
+        return self.request('DELETE', sensu_host, path, **kwargs)
+
+    @property
+    def lazy(self):
+        # Collections are generators rather than lists
+        return bool(self.stream or self.page_size)
+
+    def collection(self, sensu_host, path):
+        if self.cache is None:
+            return self.fetch_collection(sensu_host, path)
+        if self.cache.fresh(sensu_host, path):
+            values = self.cache.load(sensu_host, path)
+        else:
+            values = self.cache.store(sensu_host, path,
+                                      self.fetch_collection(sensu_host, path))
+        if self.lazy:
+            return values
+        return list(values)
+
+    def fetch_collection(self, sensu_host, path):
+        if self.page_size:
+            return self.paginated_collection(sensu_host, path)
+        if self.stream:
+            return self.stream_collection(sensu_host, path)
+        r = self.get(sensu_host, path)
+        r.raise_for_status()
+        return json.loads(r.text)
+
+    def stream_collection(self, sensu_host, path):
+        r = self.get(sensu_host, path, stream=True)
+        try:
+            r.raise_for_status()
+            chunks = iter_decoded(r.iter_content(self.chunk_size))
+            for value in iter_json_array(chunks):
+                yield value
+        finally:
+            r.close()
+
+    def page(self, sensu_host, path, offset):
+        params = {'limit': self.page_size, 'offset': offset}
+        attempt = 0
+        while True:
+            try:
+                r = self.get(sensu_host, path, params=params)
+                r.raise_for_status()
+                return json.loads(r.text)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                attempt += 1
+                if attempt > self.page_retries:
+                    raise
+                _LOGGER.warning("%s%s offset %s: %s, retrying" %
+                                (sensu_host, path, offset, e))
+                time.sleep(2 ** (attempt - 1))
+
+    def paginated_collection(self, sensu_host, path, offset=0):
+        # Walk the collection with limit/offset, each page is retried
+        # from its own offset so a transient failure never restarts
+        # the walk. With prefetch the next page is downloaded while
+        # the current one is being processed. A server ignoring limit
+        # or offset would never end the walk, it fails the host instead.
+        pool = ThreadPool(1) if self.prefetch else None
+        try:
+            values = self.page(sensu_host, path, offset)
+            previous = None
+            while values:
+                if len(values) > self.page_size:
+                    raise ValueError("%s%s answered %s values for limit %s"
+                                     % (sensu_host, path, len(values),
+                                        self.page_size))
+                if values == previous:
+                    raise ValueError("%s%s answered the same page for "
+                                     "offset %s" % (sensu_host, path, offset))
+                previous = values
+                offset += len(values)
+                last = len(values) < self.page_size
+                if pool is not None and not last:
+                    pending = pool.apply_async(self.page,
+                                               (sensu_host, path, offset))
+                for value in values:
+                    yield value
+                if last:
+                    return
+                if pool is not None:
+                    values = pending.get()
+                else:
+                    values = self.page(sensu_host, path, offset)
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    def stats(self):
+        # urllib3 counts every socket it opens per host pool, anything
+        # above that was served over an already open connection
+        connections = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+        return {
+            'requests': self.request_count,
+            'connections': connections,
+            'reused': max(self.request_count - connections, 0),
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        _LOGGER.info("Sensu API requests: %(requests)s, "
+                     "connections opened: %(connections)s, "
+                     "connections reused: %(reused)s" % stats)
+
+
+class HostFanOut(object):
+    '''
+    Fetch and parse every Sensu host with at most `workers` hosts in
+    flight. Iterating yields (sensu_host, values) in the order the hosts
+    were given; hosts that fail are logged and collected in `failed`
+    instead of ending the run.
+
+    A streaming or paginated API is walked one host at a time, so
+    `values` is a generator and memory stays bounded by one object or
+    one page.
+    '''
+
+    def __init__(self, api, sensu_hosts, fetch, workers=1):
+        self.api = api
+        self.sensu_hosts = sensu_hosts
+        self.fetch = fetch
+        self.workers = max(1, min(workers, len(sensu_hosts)))
+        if api.lazy:
+            self.workers = 1
+        self.failed = []
+
+    def _failure(self, sensu_host, error):
+        _LOGGER.error("%s: %s" % (sensu_host, error))
+        self.failed.append(sensu_host)
+
+    def _guard(self, sensu_host, values):
+        try:
+            for value in values:
+                yield value
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self._failure(sensu_host, e)
+
+    def _fetch(self, sensu_host):
+        try:
+            return sensu_host, self.fetch(self.api, sensu_host), None
+        except (requests.exceptions.RequestException, ValueError) as e:
+            return sensu_host, None, e
+
+    def __iter__(self):
+        if self.workers == 1:
+            fetched = (self._fetch(x) for x in self.sensu_hosts)
+            pool = None
+        else:
+            pool = ThreadPool(self.workers)
+            fetched = pool.imap(self._fetch, self.sensu_hosts)
+        try:
+            for sensu_host, values, error in fetched:
+                if error is not None:
+                    self._failure(sensu_host, error)
+                    continue
+                if self.api.lazy:
+                    values = self._guard(sensu_host, values)
+                yield sensu_host, values
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+
+class TokenBucket(object):
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens +
+                                  (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class BulkDelete(object):
+    '''
+    Send Sensu API deletes from a bounded pool of worker threads.
+
+    Requests are rate limited with a token bucket, timeouts, connection
+    errors and 5xx responses are retried with exponential backoff, and
+    the producer blocks once `workers` * 4 deletes are queued so a
+    streamed /results walk never buffers the whole purge. `done` is
+    called with (sensu_host, path) from the worker threads for every
+    delete that succeeded or found the object already gone.
+
+    With `defer` the deletes are only collected until close(). A
+    paginated walk has to use it: every delete shrinks the collection
+    on the server, so the next limit/offset page would skip entries
+    that were never seen.
+    '''
+
+    def __init__(self, api, workers=8, rate=0, retries=3, backoff=0.5,
+                 done=None, defer=False):
+        self.api = api
+        self.done = done
+        self.deferred = [] if defer else None
+        self.retries = retries
+        self.backoff = backoff
+        self.bucket = TokenBucket(rate, burst=workers)
+        self.queue = queue.Queue(maxsize=workers * 4)
+        self.deleted = 0
+        self.missing = 0
+        self.retried = 0
+        self.failed = []
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.finished = None
+        self.threads = []
+        for _ in range(max(workers, 1)):
+            thread = threading.Thread(target=self._worker)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def delete(self, sensu_host, path):
+        if self.deferred is not None:
+            self.deferred.append((sensu_host, path))
+            return
+        self.queue.put((sensu_host, path))
+
+    def delete_result(self, sensu_host, sensu_client, sensu_check):
+        self.delete(sensu_host, "/results/%s/%s" % (sensu_client,
+                                                     sensu_check))
+
+    def delete_client(self, sensu_host, sensu_client):
+        self.delete(sensu_host, "/clients/%s" % sensu_client)
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            self._delete(*item)
+
+    def _delete(self, sensu_host, path):
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                r = self.api.delete(sensu_host, path)
+                error = None
+                if r.status_code >= 500:
+                    error = "HTTP %s" % r.status_code
+            except requests.exceptions.RequestException as e:
+                error = e
+            if error is None:
+                break
+            if attempt >= self.retries:
+                _LOGGER.error("DELETE %s%s failed: %s" %
+                              (sensu_host, path, error))
+                with self._lock:
+                    self.failed.append((sensu_host, path))
+                return
+            attempt += 1
+            with self._lock:
+                self.retried += 1
+            time.sleep(self.backoff * 2 ** (attempt - 1))
+        with self._lock:
+            if r.status_code == 404:
+                self.missing += 1
+            elif r.status_code < 400:
+                self.deleted += 1
+            else:
+                _LOGGER.error("DELETE %s%s failed: HTTP %s" %
+                              (sensu_host, path, r.status_code))
+                self.failed.append((sensu_host, path))
+                return
+        if self.done is not None:
+            self.done(sensu_host, path)
+
+    def close(self):
+        if self.deferred:
+            _LOGGER.info("Sending %s deletes collected during the "
+                         "paginated walk" % len(self.deferred))
+            for item in self.deferred:
+                self.queue.put(item)
+        self.deferred = None
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.finished = time.time()
+
+    def summary(self):
+        elapsed = (self.finished or time.time()) - self.started
+        done = self.deleted + self.missing + len(self.failed)
+        return {
+            'deleted': self.deleted,
+            'missing': self.missing,
+            'failed': len(self.failed),
+            'retried': self.retried,
+            'elapsed': elapsed,
+            'rate': done / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def report(self):
+        return ("Deleted %(deleted)s, already gone %(missing)s, "
+                "failed %(failed)s, retried %(retried)s in "
+                "%(elapsed).1fs (%(rate).1f deletes/s)" % self.summary())
+
+
+def split_list(value):
+    if not value:
+        return []
+    return [x.strip() for x in value.split(',')]
+
+
+def positive_int(value):
+    # argparse type for counts that must be at least 1
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(
+            "must be a whole number of at least 1: %r" % value)
+    return number
+
+
+def add_api_arguments(parser):
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        required=False,
+        help="Sensu API request timeout in seconds",
+        metavar="timeout",
+        default=5.0
+    )
+    parser.add_argument(
+        "--verify",
+        help="verify the Sensu API TLS certificate",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "--pool_size",
+        type=int,
+        required=False,
+        help="Number of keep-alive connections kept per Sensu host",
+        metavar="pool_size",
+        default=10
+    )
+    parser.add_argument(
+        "--stream",
+        help="parse results one at a time as they arrive, one host at "
+             "a time, to keep memory bounded on large fleets",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "--page_size",
+        type=int,
+        required=False,
+        help="Fetch results and clients in pages of this many entries "
+             "using limit/offset, 0 fetches everything at once",
+        metavar="page_size",
+        default=0
+    )
+    parser.add_argument(
+        "--prefetch",
+        help="download the next page while the current one is processed",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "--page_retries",
+        type=int,
+        required=False,
+        help="Number of times a failed page is retried from its offset",
+        metavar="page_retries",
+        default=3
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        required=False,
+        help="Directory holding snapshots of Sensu API responses",
+        metavar="cache_dir",
+        default="~/.cache/sensu_snapshots"
+    )
+    parser.add_argument(
+        "--cache_ttl",
+        type=int,
+        required=False,
+        help="Reuse snapshots younger than this many seconds instead of "
+             "querying the Sensu API, 0 disables the snapshot cache",
+        metavar="cache_ttl",
+        default=0
+    )
+    parser.add_argument(
+        "--refresh",
+        help="ignore existing snapshots and download a new one",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        required=False,
+        help="Number of Sensu hosts queried at the same time",
+        metavar="workers",
+        default=4
+    )
+
+
+def add_delete_arguments(parser):
+    parser.add_argument(
+        "--delete_workers",
+        type=int,
+        required=False,
+        help="Number of deletes sent to the Sensu API at the same time",
+        metavar="delete_workers",
+        default=8
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        required=False,
+        help="Maximum deletes per second, 0 for no limit",
+        metavar="rate",
+        default=0
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        required=False,
+        help="Number of times a timed out or 5xx delete is retried",
+        metavar="retries",
+        default=3
+    )
+
+
+def add_stale_arguments(parser):
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=int,
+        required=False,
+        help="Seconds since the last execution after which a check is "
+             "reported as stale",
+        metavar="threshold",
+        default=14400
+    )
+    parser.add_argument(
+        "-i",
+        "--missed_intervals",
+        type=int,
+        required=False,
+        help="Report checks that missed more than this many of their own "
+             "intervals, checks without an interval use the threshold",
+        metavar="missed_intervals"
+    )
+    parser.add_argument(
+        "--top",
+        type=positive_int,
+        required=False,
+        help="Only report the K stalest checks",
+        metavar="K"
+    )
+
+
+def add_orphan_arguments(parser):
+    parser.add_argument(
+        "--purge",
+        help="delete the orphaned results instead of listing them",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "--max_orphan_ratio",
+        type=float,
+        required=False,
+        help="Refuse to purge a Sensu host where more than this share "
+             "of the clients look orphaned",
+        metavar="ratio",
+        default=0.1
+    )
+    parser.add_argument(
+        "--force",
+        help="purge even above --max_orphan_ratio",
+        action="store_true",
+        default=False
+    )
+
+
+def sensu_api(args):
+    cache = None
+    if args.cache_ttl > 0:
+        cache = SnapshotCache(args.cache_dir, args.cache_ttl,
+                              refresh=args.refresh)
+    return SensuAPI(timeout=args.timeout,
+                    verify=args.verify,
+                    pool_maxsize=max(args.pool_size,
+                                     getattr(args, 'delete_workers', 0)),
+                    stream=args.stream,
+                    page_size=args.page_size,
+                    prefetch=args.prefetch,
+                    page_retries=args.page_retries,
+                    cache=cache)
+
+
+def sensu_host_fan_out(api, sensu_hosts, fetch, args):
+    return HostFanOut(api, sensu_hosts, fetch, workers=args.workers)
+
+
+def sensu_bulk_delete(api, args, done=None):
+    # Deletes wait for the end of a paginated walk, see BulkDelete
+    return BulkDelete(api, workers=args.delete_workers, rate=args.rate,
+                      retries=args.retries, done=done,
+                      defer=bool(api.page_size))
+
+
+def fetch_results(api, sensu_host):
+    return api.collection(sensu_host, "/results")
+
+
+def fetch_clients(api, sensu_host):
+    return api.collection(sensu_host, "/clients")
+
+
+def sensu_clients_gone(api, sensu_host, sensu_clients):
+    # The clients GET /clients/<name> answers 404 for, raises
+    # RequestException when the Sensu host cannot answer
+    gone = set()
+    for sensu_client in sensu_clients:
+        r = api.get(sensu_host, "/clients/%s" % sensu_client)
+        if r.status_code == 404:
+            gone.add(sensu_client)
+        elif r.status_code >= 500:
+            r.raise_for_status()
+    return gone
+
+
+def sensu_check_result(api, sensu_host, sensu_client, check_name):
+    # Empty for a missing result, raises RequestException when the
+    # Sensu host cannot answer, e.g. from a ThreadPool worker
+    path = "/results/%s/%s" % (sensu_client, check_name)
+    r = api.get(sensu_host, path)
+    if r.status_code >= 500:
+        r.raise_for_status()
+    return r.text
+
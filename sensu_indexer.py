@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+'''
+Long running indexer that answers the Sensu reports over a Unix socket
+
+The daemon keeps every host's /results in a columnar ResultStore and
+its client names in memory, refreshed every --interval seconds, and
+runs the stale, no_ttl, dup, find and missing reports against them on
+request:
+
+    sensu_indexer.py -s sensu1,sensu2 --interval 60 &
+    sensu_stale_report.py -s sensu1,sensu2 --via_daemon
+
+Sensu has no change feed, so a refresh re-reads each host, but a host's
+index is swapped in on its own as soon as it was read completely, and
+a host that fails keeps serving its previous index. The response says
+how old the data is.
+
+The report scripts talk to the daemon through reports_via_daemon() and
+missing_via_daemon(), one JSON request and one JSON response per
+connection.
+'''
+
+# Import Standard Modules
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+try:
+    from itertools import izip as zip
+except ImportError:
+    pass
+
+try:
+    from socketserver import StreamRequestHandler, ThreadingMixIn, \
+        UnixStreamServer
+except ImportError:
+    from SocketServer import StreamRequestHandler, ThreadingMixIn, \
+        UnixStreamServer
+
+try:
+    from sensu_functions import (add_api_arguments,
+                                 fetch_clients,
+                                 fetch_results,
+                                 sensu_api,
+                                 sensu_host_fan_out)
+except ImportError:
+    print("Unable to import sensu_functions")
+    sys.exit(3)
+
+try:
+    from sensu_reports import (REPORTS,
+                               DupCheckReport,
+                               FindChecksReport,
+                               StaleReport,
+                               finish_reports)
+except ImportError:
+    print("Unable to import sensu_reports")
+    sys.exit(3)
+
+try:
+    from sensu_store import ResultStore
+except ImportError:
+    print("Unable to import sensu_store")
+    sys.exit(3)
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = '~/.cache/sensu_indexer.sock'
+
+
+class RowCollector(object):
+    # A writer keeping the rows, for the streaming output formats
+
+    def __init__(self):
+        self.rows = []
+
+    def row(self, values):
+        self.rows.append(list(values))
+
+    def close(self):
+        pass
+
+
+class Index(object):
+    '''
+    The latest complete /results store and client names of every host
+    '''
+
+    def __init__(self, api, sensu_hosts, args):
+        self.api = api
+        self.sensu_hosts = sensu_hosts
+        self.args = args
+        self.hosts = {}
+
+    def refresh(self):
+        clients = {}
+        fan_out = sensu_host_fan_out(self.api, self.sensu_hosts,
+                                     fetch_clients, self.args)
+        for sensu_host, values in fan_out:
+            names = [x['name'] for x in values]
+            if sensu_host not in fan_out.failed:
+                clients[sensu_host] = names
+        fan_out = sensu_host_fan_out(self.api, list(clients),
+                                     fetch_results, self.args)
+        for sensu_host, values in fan_out:
+            store = ResultStore().extend(values)
+            if sensu_host in fan_out.failed:
+                continue
+            # Swapping the tuple in is atomic, queries see either the
+            # old or the new index of a host
+            self.hosts[sensu_host] = (store, clients[sensu_host],
+                                      time.time())
+            _LOGGER.info("%s: indexed %s results and %s clients" %
+                         (sensu_host, len(store), len(clients[sensu_host])))
+
+    def run(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                _LOGGER.error("Refresh failed: %s" % e)
+
+    def query(self, request):
+        hosts = [(x, self.hosts.get(x)) for x in request['hosts']]
+        failed = [x for x, indexed in hosts if indexed is None]
+        hosts = [(x, indexed) for x, indexed in hosts
+                 if indexed is not None]
+        answers = []
+        for query in request['reports']:
+            if query['name'] == 'missing':
+                answers.append(self.missing(hosts, query['options']))
+                continue
+            report = REPORTS[query['name']](**query['options'])
+            if query.get('rows'):
+                report.stream_to(RowCollector())
+            for sensu_host, (store, _, _) in hosts:
+                report.add_store(sensu_host, store)
+            if report.writer is None:
+                answers.append({'text': report.render()})
+            else:
+                finish_reports([report])
+                answers.append({'rows': report.writer.rows})
+        refreshed = [x[2] for _, x in hosts]
+        return {
+            'reports': answers,
+            'failed': failed,
+            'age': time.time() - min(refreshed) if refreshed else None,
+        }
+
+    def missing(self, hosts, options):
+        rows = []
+        for sensu_host, (store, clients, _) in hosts:
+            pairs = zip(store.client, store.check_name)
+            have = set(client for client, check_name in pairs
+                       if check_name == options['check_name'])
+            rows.extend([x] for x in clients if x not in have)
+        return {'rows': rows}
+
+
+class IndexerServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+class IndexerHandler(StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            response = self.server.index.query(request)
+        except Exception as e:
+            _LOGGER.error("Bad request: %s" % e)
+            response = {'error': str(e)}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+def report_options(report):
+    # The constructor arguments the daemon rebuilds `report` from
+    if isinstance(report, StaleReport):
+        return {'threshold': report.threshold,
+                'missed_intervals': report.missed_intervals,
+                'top': report.top}
+    if isinstance(report, DupCheckReport):
+        return {'show_counts': report.show_counts}
+    if isinstance(report, FindChecksReport):
+        return {'check_names': sorted(report.matcher.names),
+                'prefixes': sorted(report.matcher.prefixes)}
+    return {}
+
+
+def query_daemon(path, sensu_hosts, reports, timeout=None):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(os.path.expanduser(path))
+        request = {'hosts': sensu_hosts, 'reports': reports}
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        sock.close()
+    response = json.loads(b''.join(chunks).decode('utf-8'))
+    if 'error' in response:
+        raise ValueError(response['error'])
+    if response['age'] is not None:
+        _LOGGER.info("Index is %.0fs old" % response['age'])
+    for sensu_host in response['failed']:
+        _LOGGER.error("%s: not indexed by the daemon" % sensu_host)
+    return response
+
+
+def reports_via_daemon(args, sensu_hosts, reports, label=False,
+                       skip_empty=False):
+    '''
+    Runs `reports` in the daemon and prints them like the scripts do,
+    rows go to the writer a report streams to (csv, tsv, jsonl or a
+    delta writer), table reports come back rendered. Returns the exit
+    code.
+    '''
+    try:
+        response = query_daemon(
+            args.via_daemon, sensu_hosts,
+            [{'name': x.name, 'options': report_options(x),
+              'rows': x.writer is not None} for x in reports],
+            timeout=args.timeout)
+    except (socket.error, ValueError) as e:
+        _LOGGER.error("%s: %s" % (args.via_daemon, e))
+        return 1
+    for report, answer in zip(reports, response['reports']):
+        if report.writer is None:
+            if label:
+                print("%s:" % report.name)
+            if answer['text'] or not skip_empty:
+                print(answer['text'])
+            continue
+        for row in answer['rows']:
+            report.writer.row(row)
+    if response['failed']:
+        for report in reports:
+            # Rows of hosts the daemon does not have are not removed
+            if hasattr(report.writer, 'partial'):
+                report.writer.partial = True
+    finish_reports(reports)
+    return 1 if response['failed'] else 0
+
+
+def missing_via_daemon(args, sensu_hosts, check_name):
+    # Returns the clients without check_name and the failed hosts
+    try:
+        response = query_daemon(
+            args.via_daemon, sensu_hosts,
+            [{'name': 'missing', 'options': {'check_name': check_name}}],
+            timeout=args.timeout)
+    except (socket.error, ValueError) as e:
+        _LOGGER.error("%s: %s" % (args.via_daemon, e))
+        return [], sensu_hosts
+    return ([x[0] for x in response['reports'][0]['rows']],
+            response['failed'])
+
+
+def add_daemon_arguments(parser):
+    parser.add_argument(
+        "--via_daemon",
+        "--via-daemon",
+        type=str,
+        nargs='?',
+        const=DEFAULT_SOCKET,
+        required=False,
+        help="Ask a running sensu_indexer.py instead of the Sensu API, "
+             "optionally giving its socket (default %s)" % DEFAULT_SOCKET,
+        metavar="socket"
+    )
+
+
+# Gather our code in a main() function
+def main(args, loglevel):
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=loglevel)
+
+    sensu_hosts = [x.strip() for x in args.sensu_hosts.split(',')]
+    api = sensu_api(args)
+
+    index = Index(api, sensu_hosts, args)
+    index.refresh()
+    path = os.path.expanduser(args.socket)
+    if os.path.exists(path):
+        os.remove(path)
+    server = IndexerServer(path, IndexerHandler)
+    server.index = index
+    os.chmod(path, 0o600)
+    refresher = threading.Thread(target=index.run, args=(args.interval,))
+    refresher.daemon = True
+    refresher.start()
+    _LOGGER.warning("Serving %s hosts on %s" % (len(index.hosts), path))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(path)
+
+
+# Standard boilerplate to call the main() function to begin
+# the program.
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description="Keeps an index of the Sensu results and answers the "
+                    "report scripts' --via_daemon queries.",
+        epilog="Available reports: %s" %
+               ", ".join(sorted(list(REPORTS) + ['missing']))
+    )
+    parser.add_argument(
+        "-s",
+        "--sensu_hosts",
+        type=str,
+        required=True,
+        help="Sensu Host",
+        metavar="sensu_host"
+    )
+    parser.add_argument(
+        "--socket",
+        type=str,
+        required=False,
+        help="Unix socket to listen on",
+        metavar="socket",
+        default=DEFAULT_SOCKET
+    )
+    parser.add_argument(
+        "--interval",
+        type=int,
+        required=False,
+        help="Seconds between refreshes of the index",
+        metavar="interval",
+        default=60
+    )
+    add_api_arguments(parser)
+    loglevel_group = parser.add_mutually_exclusive_group(required=False)
+    loglevel_group.add_argument(
+        "-v",
+        "--verbose",
+        help="increase output verbosity",
+        action="count",
+        default=0)
+    loglevel_group.add_argument(
+        "-q",
+        "--quiet",
+        help="decrease output verbosity",
+        action="count",
+        default=0)
+    args = parser.parse_args()
+
+    # Setup logging
+    # script -vv -> DEBUG
+    # script -v -> INFO
+    # script -> WARNING
+    # script -q -> ERROR
+    # script -qq -> CRITICAL
+    # script -qqq -> no logging at all
+    loglevel = logging.WARNING + 10*args.quiet - 10*args.verbose
+    # Set 'max'/'min' levels for logging
+    if loglevel > 50:
+        loglevel = 50
+    elif loglevel < 10:
+        loglevel = 10
+
+    main(args, loglevel)
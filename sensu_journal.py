@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+'''
+On-disk journal of planned Sensu deletions
+
+A purge is planned in full before the first delete is sent: the
+journal file holds one JSON line per planned delete, and completed
+deletes are appended to <journal>.done in batches. An interrupted
+purge is continued from the journal without refetching /results and
+without sending the recorded deletes again. Only the last unflushed
+batch can be resent after a crash; those deletes answer 404 and are
+counted as already gone.
+'''
+
+# Import Standard Modules
+import json
+import os
+import sys
+import threading
+
+try:
+    from sensu_functions import atomic_write
+except ImportError:
+    print("Unable to import sensu_functions")
+    sys.exit(3)
+
+
+class PurgeJournal(object):
+
+    def __init__(self, path, batch_size=100):
+        self.path = os.path.expanduser(path)
+        self.done_path = self.path + '.done'
+        self.batch_size = max(batch_size, 1)
+        self._batch = []
+        self._lock = threading.Lock()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def plan(self, entries):
+        '''
+        Writes the planned deletes, (sensu_host, client, check_name,
+        rule) each, replacing an earlier journal and its progress.
+        Returns the number of entries.
+        '''
+        count = 0
+        with atomic_write(self.path) as f:
+            for entry in entries:
+                f.write((json.dumps(list(entry)) + '\n').encode('utf-8'))
+                count += 1
+            # The old progress goes before the new plan is renamed in
+            if os.path.exists(self.done_path):
+                os.remove(self.done_path)
+        return count
+
+    def _lines(self, path):
+        try:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # The last line of a crashed run may be partial
+                        continue
+        except IOError:
+            return
+
+    def entries(self):
+        return [tuple(x) for x in self._lines(self.path)]
+
+    def completed(self):
+        return set(tuple(x) for x in self._lines(self.done_path))
+
+    def pending(self):
+        completed = self.completed()
+        return [x for x in self.entries()
+                if (x[0], result_path(x[1], x[2])) not in completed]
+
+    def mark(self, sensu_host, path):
+        # Called by the delete workers once a delete is known to be gone
+        with self._lock:
+            self._batch.append((sensu_host, path))
+            if len(self._batch) >= self.batch_size:
+                self._flush()
+
+    def _flush(self):
+        if not self._batch:
+            return
+        with open(self.done_path, 'a') as f:
+            for sensu_host, path in self._batch:
+                f.write(json.dumps([sensu_host, path]) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._batch = []
+
+    def close(self):
+        with self._lock:
+            self._flush()
+
+
+def result_path(sensu_client, check_name):
+    return "/results/%s/%s" % (sensu_client, check_name)
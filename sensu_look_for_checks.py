@@ -8,26 +8,42 @@ ARIN Ansible Base Playbook
 import argparse
 import logging
 import sys
-import json
 
 try:
-    import requests
-    from requests.packages.urllib3.exceptions import InsecureRequestWarning
-    requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+    from sensu_functions import (add_api_arguments,
+                                 fetch_results,
+                                 sensu_api,
+                                 sensu_host_fan_out)
 except ImportError:
-    print("Please install requests")
-    print("$ sudo pip install request")
+    print("Unable to import sensu_functions")
     sys.exit(3)
 
+try:
+    from sensu_reports import (FindChecksReport,
+                               finish_reports,
+                               run_reports,
+                               stream_reports)
+except ImportError:
+    print("Unable to import sensu_reports")
+    sys.exit(3)
 
-def sensu_results(sensu_host):
-    url = "https://%s/results" % sensu_host
-    try:
-        r = requests.get(url, timeout=5.0, verify=False)
-        return r.text
-    except requests.exceptions.RequestException as e:
-        print(e)
-        sys.exit(1)
+try:
+    from sensu_output import add_output_arguments
+except ImportError:
+    print("Unable to import sensu_output")
+    sys.exit(3)
+
+try:
+    from sensu_indexer import add_daemon_arguments, reports_via_daemon
+except ImportError:
+    print("Unable to import sensu_indexer")
+    sys.exit(3)
+
+try:
+    from sensu_check_index import add_index_arguments, sensu_check_index
+except ImportError:
+    print("Unable to import sensu_check_index")
+    sys.exit(3)
 
 
 # Gather our code in a main() function
@@ -35,6 +51,7 @@ def main(args, loglevel):
     logging.basicConfig(format="%(levelname)s: %(message)s", level=loglevel)
 
     sensu_hosts = [x.strip() for x in args.sensu_hosts.split(',')]
+    api = sensu_api(args)
 
     purge_metrics = [
         'CPU_Metrics',
@@ -50,20 +67,24 @@ def main(args, loglevel):
         'Running_Process_Metrics',
     ]
 
-    node_list = []
-    for sensu_host in sensu_hosts:
-        r = sensu_results(sensu_host)
-
-        values = json.loads(r)
-
-        for index in values:
-            client = index['client']
-            check_name = index['check']['name']
-            if check_name in purge_metrics:
-                node_list.append(client)
-
-    for i in set(node_list):
-        print i
+    report = FindChecksReport(check_names=purge_metrics)
+    stream_reports([report], args.format)
+    if args.via_daemon:
+        sys.exit(reports_via_daemon(args, sensu_hosts, [report],
+                                    skip_empty=True))
+    if args.index:
+        index, failed = sensu_check_index(api, sensu_hosts, args)
+        report.add_index(index)
+    else:
+        hosts = sensu_host_fan_out(api, sensu_hosts, fetch_results, args)
+        run_reports(hosts, [report])
+        failed = hosts.failed
+    if report.writer is None and report.clients:
+        print(report.render())
+    finish_reports([report])
+    api.log_stats()
+    if failed:
+        sys.exit(1)
 
 
 # Standard boilerplate to call the main() function to begin
@@ -83,6 +104,10 @@ if __name__ == '__main__':
         help="Sensu Host",
         metavar="sensu_host"
     )
+    add_output_arguments(parser)
+    add_daemon_arguments(parser)
+    add_index_arguments(parser)
+    add_api_arguments(parser)
     loglevel_group = parser.add_mutually_exclusive_group(required=False)
     loglevel_group.add_argument(
         "-v",
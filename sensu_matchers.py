@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+'''
+Matchers used to select Sensu results by check name
+'''
+
+# Placeholder for the client name in per-client check templates
+CLIENT = '<client>'
+# A template prefix ends with one of these, so "mongodb" of client
+# "db" stays a check name instead of becoming mongo<client>
+SEPARATORS = '_-.'
+
+
+class CheckMatcher(object):
+    '''
+    Match check names against exact names and per-client templates
+    such as CPU_Metrics_on_<client>.
+
+    A check name is split once into a (prefix, client) pair using the
+    result's own client, and the prefix is looked up in a set, so the
+    cost per result does not grow with the number of patterns.
+    '''
+
+    def __init__(self, names=(), prefixes=()):
+        self.names = frozenset(names)
+        self.prefixes = frozenset(prefixes)
+
+    def split(self, client, check_name):
+        if client and check_name.endswith(client):
+            return check_name[:-len(client)], client
+        return check_name, None
+
+    def match(self, client, check_name):
+        if check_name in self.names:
+            return True
+        prefix, check_client = self.split(client, check_name)
+        return check_client is not None and prefix in self.prefixes
+
+    def template(self, client, check_name):
+        # CPU_Metrics_on_<client> for CPU_Metrics_on_<the result's client>
+        prefix, check_client = self.split(client, check_name)
+        if check_client is None or prefix[-1:] not in SEPARATORS:
+            return check_name
+        return prefix + CLIENT
@@ -7,15 +7,36 @@ Add some documentation here
 import argparse
 import logging
 import sys
-import json
+from multiprocessing.pool import ThreadPool
 
 try:
     import requests
-    from requests.packages.urllib3.exceptions import InsecureRequestWarning
-    requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 except ImportError:
     print "Please install requests"
-    print "$ sudo pip install request"
+    print "$ sudo pip install requests"
+    sys.exit(3)
+
+try:
+    from sensu_functions import (add_api_arguments,
+                                 fetch_clients,
+                                 fetch_results,
+                                 sensu_api,
+                                 sensu_check_result,
+                                 sensu_host_fan_out)
+except ImportError:
+    print "Unable to import sensu_functions"
+    sys.exit(3)
+
+try:
+    from sensu_reports import missing_check_clients
+except ImportError:
+    print "Unable to import sensu_reports"
+    sys.exit(3)
+
+try:
+    from sensu_output import add_output_arguments, row_writer
+except ImportError:
+    print "Unable to import sensu_output"
     sys.exit(3)
 
 try:
@@ -25,26 +46,26 @@ except ImportError:
     print "$ sudo pip install prettytable"
     sys.exit(3)
 
+try:
+    from sensu_indexer import add_daemon_arguments, missing_via_daemon
+except ImportError:
+    print "Unable to import sensu_indexer"
+    sys.exit(3)
 
-def sensu_find_check_result(sensu_host, sensu_client, check_name):
-    url = "https://%s/results/%s/%s" % (sensu_host, sensu_client,
-                                        check_name)
-    try:
-        r = requests.get(url, timeout=5.0, verify=False)
-        return r.text
-    except requests.exceptions.RequestException as e:
-        print e
-        sys.exit(1)
 
+def lookup_missing(api, sensu_host, clients, check_name, workers):
+    # Targeted /results/<client>/<check> lookups, sent concurrently.
+    # pool.map re-raises the first RequestException of a worker
+    def missing(sensu_client):
+        return not sensu_check_result(api, sensu_host, sensu_client,
+                                      check_name)
 
-def sensu_client_results(sensu_host):
-    url = "https://%s/clients" % sensu_host
+    pool = ThreadPool(max(workers, 1))
     try:
-        r = requests.get(url, timeout=5.0, verify=False)
-        return r.text
-    except requests.exceptions.RequestException as e:
-        print e
-        sys.exit(1)
+        flags = pool.map(missing, clients)
+    finally:
+        pool.terminate()
+    return [x for x, flag in zip(clients, flags) if flag]
 
 
 # Gather our code in a main() function
@@ -52,26 +73,54 @@ def main(args, loglevel):
     logging.basicConfig(format="%(levelname)s: %(message)s", level=loglevel)
 
     sensu_hosts = [x.strip() for x in args.sensu_hosts.split(',')]
+    api = sensu_api(args)
 
     t = PrettyTable(['Client'])
-    for sensu_host in sensu_hosts:
-        all_sensu_clients = []
-        r = sensu_client_results(sensu_host)
-
-        values = json.loads(r)
-
-        for index in values:
-            client = index['name']
-            all_sensu_clients.append(client)
-
-        for sensu_client in all_sensu_clients:
-            check_name = 'Check_Collectd_Process'
-            r = sensu_find_check_result(sensu_host, sensu_client, check_name)
-            if not r:
-                t.add_row([
-                    sensu_client,
-                ])
-    print t
+    writer = row_writer(args.format, ['Client'])
+    add_row = t.add_row if writer is None else writer.row
+    if args.via_daemon:
+        missing, failed = missing_via_daemon(args, sensu_hosts,
+                                             args.check_name)
+        for sensu_client in missing:
+            add_row([sensu_client])
+    else:
+        all_sensu_clients = {}
+        hosts = sensu_host_fan_out(api, sensu_hosts, fetch_clients, args)
+        for sensu_host, values in hosts:
+            all_sensu_clients[sensu_host] = [x['name'] for x in values]
+        if args.lookup:
+            failed = hosts.failed
+            for sensu_host in sensu_hosts:
+                if sensu_host not in all_sensu_clients:
+                    continue
+                try:
+                    missing = lookup_missing(api, sensu_host,
+                                             all_sensu_clients[sensu_host],
+                                             args.check_name, args.workers)
+                except requests.exceptions.RequestException as e:
+                    logging.error("%s: %s" % (sensu_host, e))
+                    failed.append(sensu_host)
+                    continue
+                for sensu_client in missing:
+                    add_row([sensu_client])
+        else:
+            results = sensu_host_fan_out(api, list(all_sensu_clients),
+                                         fetch_results, args)
+            missing = {}
+            for sensu_host, values in results:
+                missing[sensu_host] = missing_check_clients(
+                    all_sensu_clients[sensu_host], values, args.check_name)
+            for sensu_host in sensu_hosts:
+                for sensu_client in missing.get(sensu_host, []):
+                    add_row([sensu_client])
+            failed = hosts.failed + results.failed
+    if writer is None:
+        print t
+    else:
+        writer.close()
+    api.log_stats()
+    if failed:
+        sys.exit(1)
 
 
 # Standard boilerplate to call the main() function to begin
@@ -91,6 +140,25 @@ if __name__ == '__main__':
         help="Sensu Host",
         metavar="sensu_host"
     )
+    parser.add_argument(
+        "-c",
+        "--check_name",
+        type=str,
+        required=False,
+        help="Check every client is expected to have a result for",
+        metavar="check_name",
+        default="Check_Collectd_Process"
+    )
+    parser.add_argument(
+        "--lookup",
+        help="query /results/<client>/<check> for each client instead of "
+             "downloading /results once",
+        action="store_true",
+        default=False
+    )
+    add_output_arguments(parser)
+    add_daemon_arguments(parser)
+    add_api_arguments(parser)
     loglevel_group = parser.add_mutually_exclusive_group(required=False)
     loglevel_group.add_argument(
         "-v",
@@ -0,0 +1,472 @@
+#!/usr/bin/env python
+'''
+Local stand-in for the Sensu API, serving a synthetic fleet
+
+Implements GET /clients, GET /results (with limit/offset), GET and
+DELETE /results/<client>/<check> and DELETE /clients/<client>, so the
+report and purge scripts can be run offline:
+
+    sensu_mock_api.py --clients 10000 --port 4567 &
+    sensu_stale_report.py -s http://127.0.0.1:4567
+
+Like the Sensu versions these scripts were written against, deleting a
+client leaves its results behind. GET /mock/stats returns the request
+and byte counters, which sensu_benchmark.py reads.
+'''
+
+# Import Standard Modules
+import argparse
+import json
+import logging
+import random
+import re
+import sys
+import threading
+import time
+
+try:
+    from urllib.parse import parse_qs, unquote, urlparse
+except ImportError:
+    from urllib import unquote
+    from urlparse import parse_qs, urlparse
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+_LOGGER = logging.getLogger(__name__)
+
+CHECK_TEMPLATES = [
+    'CPU_Metrics_on_',
+    'Memory_Metrics_on_',
+    'Disk_Metrics_on_',
+    'Check_Ping4_',
+    'Check_DNS_Metrics_on_',
+]
+VERSIONS = ['0.26.0', '0.26.5', '0.28.4', '0.29.0', '1.2.1']
+SUBSCRIPTIONS = ['base', 'web', 'db', 'dns', 'mail']
+
+
+def pick(rand, values):
+    # random.choice and randint draw differently on Python 2 and 3,
+    # random() is the same for a given seed on both
+    return values[int(rand.random() * len(values))]
+
+
+def between(rand, low, high):
+    return low + int(rand.random() * (high - low + 1))
+
+
+def build_fleet(clients=1000, checks=5, on_client_ratio=0.5,
+                no_ttl_ratio=0.1, stale_ratio=0.05, collectd_ratio=0.9,
+                interval=60, seed=0, now=None):
+    '''
+    Returns (clients, results) for a synthetic fleet. Every client
+    gets a keepalive plus `checks` checks, `on_client_ratio` of them
+    named <template><client> and originated by the client itself,
+    `collectd_ratio` of the clients run Check_Collectd_Process, and
+    the TTL and stale ratios apply per check. The same seed always
+    builds the same fleet, on Python 2 and 3 alike.
+    '''
+    rand = random.Random(seed)
+    now = int(now or time.time())
+    client_list = []
+    results = []
+    for number in range(clients):
+        name = "client%06d" % number
+        client_list.append({
+            'name': name,
+            'address': '10.%d.%d.%d' % (number >> 16 & 255,
+                                        number >> 8 & 255, number & 255),
+            'version': pick(rand, VERSIONS),
+            'subscriptions': ['base', pick(rand, SUBSCRIPTIONS[1:])],
+            'timestamp': now - between(rand, 0, 90 * 86400),
+        })
+        results.append({'client': name, 'check': {
+            'name': 'keepalive', 'executed': now - between(rand, 0, 20),
+            'status': 0, 'issued': now}})
+        names = []
+        if rand.random() < collectd_ratio:
+            names.append(('Check_Collectd_Process', None))
+        for template in range(checks):
+            if rand.random() < on_client_ratio:
+                names.append(("%s%s" % (CHECK_TEMPLATES[template %
+                                                       len(CHECK_TEMPLATES)],
+                                        name), name))
+            else:
+                names.append(("check_%03d" % template, None))
+        for check_name, origin in names:
+            if rand.random() < stale_ratio:
+                executed = now - between(rand, 5 * 3600, 30 * 86400)
+            else:
+                executed = now - between(rand, 0, interval)
+            check = {
+                'name': check_name,
+                'executed': executed,
+                'issued': executed,
+                'interval': interval,
+                'status': pick(rand, [0, 0, 0, 0, 1, 2]),
+                'output': 'OK',
+            }
+            if rand.random() >= no_ttl_ratio:
+                check['ttl'] = interval * 5
+            if origin is not None:
+                check['origin'] = origin
+            results.append({'client': name, 'check': check})
+    return client_list, results
+
+
+class Fleet(object):
+    '''
+    Clients and results keyed by name so deletes are constant time,
+    the listing order is only compacted and the serialized collections
+    only rebuilt after a delete
+    '''
+
+    def __init__(self, clients, results):
+        self.lock = threading.Lock()
+        self.clients = dict((x['name'], x) for x in clients)
+        self.client_order = [x['name'] for x in clients]
+        self.results = dict(((x['client'], x['check']['name']), x)
+                            for x in results)
+        self.result_order = [(x['client'], x['check']['name'])
+                             for x in results]
+        self._bodies = {}
+        self._lists = {}
+
+    def collection(self, endpoint):
+        with self.lock:
+            values = self._lists.get(endpoint)
+            if values is not None:
+                return values
+            if endpoint == '/clients':
+                self.client_order = [x for x in self.client_order
+                                     if x in self.clients]
+                values = [self.clients[x] for x in self.client_order]
+            else:
+                self.result_order = [x for x in self.result_order
+                                     if x in self.results]
+                values = [self.results[x] for x in self.result_order]
+            self._lists[endpoint] = values
+            return values
+
+    def body(self, endpoint):
+        with self.lock:
+            body = self._bodies.get(endpoint)
+        if body is None:
+            body = json.dumps(self.collection(endpoint)).encode('utf-8')
+            with self.lock:
+                self._bodies[endpoint] = body
+        return body
+
+    def delete_result(self, client, check_name):
+        with self.lock:
+            if self.results.pop((client, check_name), None) is None:
+                return False
+            self._bodies.pop('/results', None)
+            self._lists.pop('/results', None)
+            return True
+
+    def delete_client(self, client):
+        with self.lock:
+            if self.clients.pop(client, None) is None:
+                return False
+            self._bodies.pop('/clients', None)
+            self._lists.pop('/clients', None)
+            return True
+
+
+class MockSensuServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address, fleet, latency=0.0, delete_latency=0.0,
+                 error_rate=0.0, seed=0):
+        HTTPServer.__init__(self, address, MockSensuHandler)
+        self.fleet = fleet
+        self.latency = latency
+        self.delete_latency = delete_latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'gets': 0, 'deletes': 0, 'errors': 0,
+                      'bytes_sent': 0}
+
+    def count(self, key, value=1):
+        with self.stats_lock:
+            self.stats[key] += value
+
+
+RESULT_PATH = re.compile(r'^/results/([^/]+)/([^/]+)$')
+CLIENT_PATH = re.compile(r'^/clients/([^/]+)$')
+
+
+class MockSensuHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        _LOGGER.debug("%s %s" % (self.address_string(), format % args))
+
+    def send(self, code, body=b''):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count('bytes_sent', len(body))
+
+    def inject(self, latency):
+        # Returns True when the request was failed on purpose
+        self.server.count('requests')
+        if latency:
+            time.sleep(latency)
+        if self.server.error_rate and \
+                self.server.random.random() < self.server.error_rate:
+            self.server.count('errors')
+            self.send(500, {'error': 'injected failure'})
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/mock/stats':
+            with self.server.stats_lock:
+                stats = dict(self.server.stats)
+            return self.send(200, stats)
+        self.server.count('gets')
+        if self.inject(self.server.latency):
+            return
+        fleet = self.server.fleet
+        if url.path in ('/clients', '/results'):
+            query = parse_qs(url.query)
+            if 'limit' not in query:
+                return self.send(200, fleet.body(url.path))
+            offset = int(query.get('offset', ['0'])[0])
+            limit = int(query['limit'][0])
+            values = fleet.collection(url.path)
+            return self.send(200, values[offset:offset + limit])
+        match = RESULT_PATH.match(url.path)
+        if match:
+            client, check_name = [unquote(x) for x in match.groups()]
+            result = fleet.results.get((client, check_name))
+            if result is None:
+                return self.send(404)
+            return self.send(200, result)
+        match = CLIENT_PATH.match(url.path)
+        if match:
+            client = fleet.clients.get(unquote(match.group(1)))
+            if client is None:
+                return self.send(404)
+            return self.send(200, client)
+        self.send(404)
+
+    def do_DELETE(self):
+        url = urlparse(self.path)
+        self.server.count('deletes')
+        if self.inject(self.server.delete_latency):
+            return
+        fleet = self.server.fleet
+        match = RESULT_PATH.match(url.path)
+        if match:
+            client, check_name = [unquote(x) for x in match.groups()]
+            return self.send(204 if fleet.delete_result(client, check_name)
+                             else 404)
+        match = CLIENT_PATH.match(url.path)
+        if match:
+            return self.send(202 if fleet.delete_client(
+                unquote(match.group(1))) else 404)
+        self.send(404)
+
+
+def mock_server(fleet, host='127.0.0.1', port=0, latency=0.0,
+                delete_latency=0.0, error_rate=0.0, seed=0):
+    '''
+    Starts a MockSensuServer in a background thread and returns it,
+    server.server_address holds the port picked when port is 0
+    '''
+    server = MockSensuServer((host, port), fleet, latency=latency,
+                             delete_latency=delete_latency,
+                             error_rate=error_rate, seed=seed)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+# Gather our code in a main() function
+def main(args, loglevel):
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=loglevel)
+
+    clients, results = build_fleet(clients=args.clients,
+                                   checks=args.checks,
+                                   on_client_ratio=args.on_client_ratio,
+                                   no_ttl_ratio=args.no_ttl_ratio,
+                                   stale_ratio=args.stale_ratio,
+                                   collectd_ratio=args.collectd_ratio,
+                                   seed=args.seed)
+    if args.dump:
+        json.dump({'clients': clients, 'results': results}, sys.stdout)
+        return
+    server = MockSensuServer((args.address, args.port),
+                             Fleet(clients, results),
+                             latency=args.latency,
+                             delete_latency=args.delete_latency,
+                             error_rate=args.error_rate,
+                             seed=args.seed)
+    _LOGGER.warning("Serving %s clients and %s results on http://%s:%s" %
+                    (len(clients), len(results), args.address,
+                     server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+# Standard boilerplate to call the main() function to begin
+# the program.
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description="Serves a synthetic fleet through a local stand-in "
+                    "for the Sensu API.",
+        epilog="Point the scripts at it with -s http://<address>:<port>"
+    )
+    parser.add_argument(
+        "--address",
+        type=str,
+        required=False,
+        help="Address to listen on",
+        metavar="address",
+        default="127.0.0.1"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        required=False,
+        help="Port to listen on",
+        metavar="port",
+        default=4567
+    )
+    parser.add_argument(
+        "--clients",
+        type=int,
+        required=False,
+        help="Number of clients in the fleet",
+        metavar="clients",
+        default=1000
+    )
+    parser.add_argument(
+        "--checks",
+        type=int,
+        required=False,
+        help="Checks per client, besides keepalive and "
+             "Check_Collectd_Process",
+        metavar="checks",
+        default=5
+    )
+    parser.add_argument(
+        "--on_client_ratio",
+        type=float,
+        required=False,
+        help="Share of checks named <check>_on_<client>",
+        metavar="ratio",
+        default=0.5
+    )
+    parser.add_argument(
+        "--no_ttl_ratio",
+        type=float,
+        required=False,
+        help="Share of checks without a TTL",
+        metavar="ratio",
+        default=0.1
+    )
+    parser.add_argument(
+        "--stale_ratio",
+        type=float,
+        required=False,
+        help="Share of checks that last executed hours to days ago",
+        metavar="ratio",
+        default=0.05
+    )
+    parser.add_argument(
+        "--collectd_ratio",
+        type=float,
+        required=False,
+        help="Share of clients running Check_Collectd_Process",
+        metavar="ratio",
+        default=0.9
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        required=False,
+        help="Seconds added to every GET",
+        metavar="seconds",
+        default=0.0
+    )
+    parser.add_argument(
+        "--delete_latency",
+        type=float,
+        required=False,
+        help="Seconds added to every DELETE",
+        metavar="seconds",
+        default=0.0
+    )
+    parser.add_argument(
+        "--error_rate",
+        type=float,
+        required=False,
+        help="Share of requests answered with a 500",
+        metavar="ratio",
+        default=0.0
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        required=False,
+        help="Random seed, the same seed builds the same fleet",
+        metavar="seed",
+        default=0
+    )
+    parser.add_argument(
+        "--dump",
+        help="print the fleet as JSON instead of serving it",
+        action="store_true",
+        default=False
+    )
+    loglevel_group = parser.add_mutually_exclusive_group(required=False)
+    loglevel_group.add_argument(
+        "-v",
+        "--verbose",
+        help="increase output verbosity",
+        action="count",
+        default=0)
+    loglevel_group.add_argument(
+        "-q",
+        "--quiet",
+        help="decrease output verbosity",
+        action="count",
+        default=0)
+    args = parser.parse_args()
+
+    # Setup logging
+    # script -vv -> DEBUG
+    # script -v -> INFO
+    # script -> WARNING
+    # script -q -> ERROR
+    # script -qq -> CRITICAL
+    # script -qqq -> no logging at all
+    loglevel = logging.WARNING + 10*args.quiet - 10*args.verbose
+    # Set 'max'/'min' levels for logging
+    if loglevel > 50:
+        loglevel = 50
+    elif loglevel < 10:
+        loglevel = 10
+
+    main(args, loglevel)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+'''
+Report and purge Sensu results whose client no longer exists
+
+Deleting a client leaves its results behind, and they are downloaded
+again by every later /results report. /clients and /results are
+fetched concurrently for every Sensu host and hash-joined on the
+client name. With --purge the orphaned results are deleted through
+the bounded delete pool, once GET /clients/<name> confirmed that their
+client is gone. A host whose /clients is empty is skipped, and one
+where more than --max_orphan_ratio of the clients look orphaned is
+only purged with --force.
+'''
+
+# Import Standard Modules
+import argparse
+import logging
+import sys
+from multiprocessing.pool import ThreadPool
+
+try:
+    import requests
+except ImportError:
+    print("Please install requests")
+    print("$ sudo pip install requests")
+    sys.exit(3)
+
+try:
+    from sensu_functions import (add_api_arguments,
+                                 add_delete_arguments,
+                                 add_orphan_arguments,
+                                 fetch_clients,
+                                 fetch_results,
+                                 sensu_api,
+                                 sensu_bulk_delete,
+                                 sensu_clients_gone,
+                                 sensu_host_fan_out)
+except ImportError:
+    print("Unable to import sensu_functions")
+    sys.exit(3)
+
+try:
+    from sensu_reports import orphaned_results
+except ImportError:
+    print("Unable to import sensu_reports")
+    sys.exit(3)
+
+try:
+    from sensu_output import add_output_arguments, row_writer
+except ImportError:
+    print("Unable to import sensu_output")
+    sys.exit(3)
+
+try:
+    from prettytable import PrettyTable
+except ImportError:
+    print("Please install prettytable:")
+    print("$ sudo pip install prettytable")
+    sys.exit(3)
+
+
+def client_names(api, sensu_host):
+    return set(x['name'] for x in fetch_clients(api, sensu_host))
+
+
+def fetch_orphans(api, sensu_host):
+    '''
+    Returns the client names and the orphaned results of one Sensu host.
+    /clients is the small build side of the join, it is downloaded in
+    the background while /results is fetched here.
+    '''
+    pool = ThreadPool(1)
+    try:
+        pending = pool.apply_async(client_names, (api, sensu_host))
+        results = fetch_results(api, sensu_host)
+        clients = pending.get()
+    finally:
+        pool.terminate()
+    if not clients:
+        # An empty answer would make every result look orphaned
+        raise ValueError("/clients is empty, not looking for orphans")
+    orphans = orphaned_results(clients, results)
+    if api.lazy:
+        return clients, orphans
+    return clients, list(orphans)
+
+
+def confirm_orphans(api, sensu_host, orphans, client_count, max_ratio,
+                    force=False):
+    '''
+    Returns the orphaned results of one Sensu host that are safe to
+    delete: those of clients GET /clients/<name> answers 404 for. Raises
+    ValueError when more than `max_ratio` of the clients look orphaned,
+    unless `force` is set.
+    '''
+    orphan_clients = set(x['client'] for x in orphans)
+    if not orphan_clients:
+        return []
+    ratio = len(orphan_clients) / float(len(orphan_clients) + client_count)
+    if ratio > max_ratio and not force:
+        raise ValueError("%.0f%% of the clients look orphaned, more than "
+                         "--max_orphan_ratio, use --force to purge them"
+                         % (ratio * 100))
+    gone = sensu_clients_gone(api, sensu_host, orphan_clients)
+    for client in sorted(orphan_clients - gone):
+        logging.warning("%s: %s is registered, keeping its results" %
+                        (sensu_host, client))
+    return [x for x in orphans if x['client'] in gone]
+
+
+# Gather our code in a main() function
+def main(args, loglevel):
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=loglevel)
+
+    sensu_hosts = [x.strip() for x in args.sensu_hosts.split(',')]
+    api = sensu_api(args)
+
+    client_counts = {}
+
+    def fetch(api, sensu_host):
+        clients, orphans = fetch_orphans(api, sensu_host)
+        client_counts[sensu_host] = len(clients)
+        return orphans
+
+    deleter = None
+    if args.purge:
+        deleter = sensu_bulk_delete(api, args)
+    fields = ['Sensu Host', 'Client', 'Check Name']
+    writer = row_writer(args.format, fields)
+    table = PrettyTable(fields)
+    add_row = table.add_row if writer is None else writer.row
+    clients = set()
+    count = 0
+    failed = []
+    hosts = sensu_host_fan_out(api, sensu_hosts, fetch, args)
+    for sensu_host, values in hosts:
+        orphans = values
+        if deleter is not None:
+            try:
+                orphans = confirm_orphans(api, sensu_host, list(values),
+                                          client_counts[sensu_host],
+                                          args.max_orphan_ratio, args.force)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logging.error("%s: %s" % (sensu_host, e))
+                failed.append(sensu_host)
+                continue
+        for result in orphans:
+            client = result['client']
+            check_name = result['check']['name']
+            count += 1
+            clients.add((sensu_host, client))
+            if deleter is not None:
+                deleter.delete_result(sensu_host, client, check_name)
+            else:
+                add_row([sensu_host, client, check_name])
+    if deleter is not None:
+        deleter.close()
+    elif writer is not None:
+        writer.close()
+    else:
+        print(table)
+    if writer is None or deleter is not None:
+        print("Orphaned results: %s of %s deleted clients" %
+              (count, len(clients)))
+    if deleter is not None:
+        print(deleter.report())
+    api.log_stats()
+    if hosts.failed or failed or (deleter is not None and deleter.failed):
+        sys.exit(1)
+
+
+# Standard boilerplate to call the main() function to begin
+# the program.
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description="Lists, or deletes, the Sensu results of clients that "
+                    "no longer exist.",
+        epilog=""
+    )
+    parser.add_argument(
+        "-s",
+        "--sensu_hosts",
+        type=str,
+        required=True,
+        help="Sensu Host",
+        metavar="sensu_host"
+    )
+    add_orphan_arguments(parser)
+    add_output_arguments(parser)
+    add_api_arguments(parser)
+    add_delete_arguments(parser)
+    loglevel_group = parser.add_mutually_exclusive_group(required=False)
+    loglevel_group.add_argument(
+        "-v",
+        "--verbose",
+        help="increase output verbosity",
+        action="count",
+        default=0)
+    loglevel_group.add_argument(
+        "-q",
+        "--quiet",
+        help="decrease output verbosity",
+        action="count",
+        default=0)
+    args = parser.parse_args()
+
+    # Setup logging
+    # script -vv -> DEBUG
+    # script -v -> INFO
+    # script -> WARNING
+    # script -q -> ERROR
+    # script -qq -> CRITICAL
+    # script -qqq -> no logging at all
+    loglevel = logging.WARNING + 10*args.quiet - 10*args.verbose
+    # Set 'max'/'min' levels for logging
+    if loglevel > 50:
+        loglevel = 50
+    elif loglevel < 10:
+        loglevel = 10
+
+    main(args, loglevel)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+'''
+Output formats for the Sensu reports
+
+The table format buffers every row for PrettyTable, the csv, tsv and
+jsonl formats write each row to stdout as soon as it is produced.
+'''
+
+# Import Standard Modules
+import csv
+import json
+import sys
+
+FORMATS = ['table', 'csv', 'tsv', 'jsonl']
+
+# Formats with a single header row, they can hold one report only
+DELIMITED_FORMATS = ['csv', 'tsv']
+
+
+class DelimitedWriter(object):
+
+    def __init__(self, fields, delimiter=',', label=None, stream=None):
+        self.fields = list(fields)
+        self.label = label
+        self.writer = csv.writer(stream or sys.stdout, delimiter=delimiter,
+                                 lineterminator='\n')
+        self.header = False
+
+    def row(self, values):
+        if not self.header:
+            self.header = True
+            self._write(['Report'] + self.fields if self.label
+                        else self.fields)
+        self._write([self.label] + list(values) if self.label
+                    else values)
+
+    def _write(self, values):
+        self.writer.writerow([_text(x) for x in values])
+
+    def close(self):
+        if not self.header:
+            self.header = True
+            self._write(['Report'] + self.fields if self.label
+                        else self.fields)
+
+
+class JSONLinesWriter(object):
+
+    def __init__(self, fields, label=None, stream=None):
+        self.fields = list(fields)
+        self.label = label
+        self.stream = stream or sys.stdout
+
+    def row(self, values):
+        entry = dict(zip(self.fields, values))
+        if self.label:
+            entry['report'] = self.label
+        self.stream.write(json.dumps(entry, sort_keys=True) + '\n')
+
+    def close(self):
+        self.stream.flush()
+
+
+class TableWriter(object):
+    '''
+    Buffers rows into a PrettyTable printed by close(), for callers that
+    produce rows through a writer but still want the table format
+    '''
+
+    def __init__(self, fields, title=None, stream=None):
+        # Imported here so the streaming formats work without prettytable
+        from prettytable import PrettyTable
+        self.table = PrettyTable(list(fields))
+        self.title = title
+        self.stream = stream or sys.stdout
+
+    def row(self, values):
+        self.table.add_row(list(values))
+
+    def close(self):
+        if self.title:
+            self.stream.write(self.title + '\n')
+        self.stream.write(self.table.get_string() + '\n')
+        self.stream.flush()
+
+
+def _text(value):
+    # The csv module of Python 2 only writes byte strings
+    if sys.version_info[0] < 3 and isinstance(value, unicode):  # noqa
+        return value.encode('utf-8')
+    return value
+
+
+def row_writer(fmt, fields, label=None, stream=None):
+    '''
+    Returns a streaming writer for `fmt`, or None for the table format
+    which is rendered by the report itself
+    '''
+    if fmt == 'csv':
+        return DelimitedWriter(fields, label=label, stream=stream)
+    if fmt == 'tsv':
+        return DelimitedWriter(fields, delimiter='\t', label=label,
+                               stream=stream)
+    if fmt == 'jsonl':
+        return JSONLinesWriter(fields, label=label, stream=stream)
+    return None
+
+
+def add_output_arguments(parser):
+    parser.add_argument(
+        "-f",
+        "--format",
+        type=str,
+        required=False,
+        choices=FORMATS,
+        help="Output format, csv, tsv and jsonl rows are streamed as "
+             "they are found, combine several reports with jsonl",
+        metavar="format",
+        default="table"
+    )
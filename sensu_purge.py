@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+'''
+Purge Sensu results selected by a rule file
+
+Replaces the hardcoded sensu_delete_* scripts: every rule in the file
+is compiled into one matcher and applied in a single pass over
+/results, see sensu_rules.py for the rule format and
+sensu_purge_rules.json for the rules of the old scripts.
+'''
+
+# Import Standard Modules
+import argparse
+import logging
+import sys
+import time
+
+try:
+    from sensu_functions import (add_api_arguments,
+                                 add_delete_arguments,
+                                 fetch_results,
+                                 sensu_api,
+                                 sensu_bulk_delete,
+                                 sensu_host_fan_out)
+except ImportError:
+    print("Unable to import sensu_functions")
+    sys.exit(3)
+
+try:
+    from sensu_rules import load_rules
+except ImportError:
+    print("Unable to import sensu_rules")
+    sys.exit(3)
+
+try:
+    from sensu_journal import PurgeJournal
+except ImportError:
+    print("Unable to import sensu_journal")
+    sys.exit(3)
+
+try:
+    from sensu_output import add_output_arguments, row_writer
+except ImportError:
+    print("Unable to import sensu_output")
+    sys.exit(3)
+
+try:
+    from prettytable import PrettyTable
+except ImportError:
+    print("Please install prettytable:")
+    print("$ sudo pip install prettytable")
+    sys.exit(3)
+
+
+def plan_purge(hosts, rules):
+    now = time.time()
+    for sensu_host, values in hosts:
+        for index in values:
+            client = index['client']
+            rule = rules.match(client, index['check'], now)
+            if rule is not None:
+                yield sensu_host, client, index['check']['name'], rule.name
+
+
+# Gather our code in a main() function
+def main(args, loglevel):
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=loglevel)
+
+    journal = PurgeJournal(args.journal, batch_size=args.batch_size)
+    api = sensu_api(args)
+    failed = []
+    if args.resume:
+        if not journal.exists():
+            print("No purge journal at %s" % journal.path)
+            sys.exit(3)
+        entries = journal.pending()
+        sys.stderr.write("Resuming %s of %s planned deletes\n" %
+                         (len(entries), len(journal.entries())))
+    else:
+        if not args.sensu_hosts or not args.rules:
+            print("--sensu_hosts and --rules are required unless --resume")
+            sys.exit(3)
+        sensu_hosts = [x.strip() for x in args.sensu_hosts.split(',')]
+        try:
+            rules = load_rules(args.rules)
+        except (IOError, ValueError) as e:
+            print("Unable to load %s: %s" % (args.rules, e))
+            sys.exit(3)
+        hosts = sensu_host_fan_out(api, sensu_hosts, fetch_results, args)
+        journal.plan(plan_purge(hosts, rules))
+        failed = hosts.failed
+        entries = journal.pending()
+
+    counts = {}
+    order = []
+    for entry in entries:
+        if entry[3] not in counts:
+            counts[entry[3]] = 0
+            order.append(entry[3])
+        counts[entry[3]] += 1
+    writer = None
+    if args.dry_run:
+        fields = ['Sensu Host', 'Client', 'Check Name', 'Rule']
+        writer = row_writer(args.format, fields)
+        if writer is None:
+            table = PrettyTable(fields)
+            for entry in entries:
+                table.add_row(list(entry))
+            print(table)
+        else:
+            for entry in entries:
+                writer.row(list(entry))
+            writer.close()
+    if writer is None:
+        summary = PrettyTable(['Rule', 'Results'])
+        for rule in order:
+            summary.add_row([rule, counts[rule]])
+        print(summary)
+    if args.dry_run:
+        if writer is None:
+            print("Planned in %s, run with --resume to delete" %
+                  journal.path)
+        api.log_stats()
+        sys.exit(1 if failed else 0)
+
+    deleter = sensu_bulk_delete(api, args, done=journal.mark)
+    try:
+        for sensu_host, client, check_name, _ in entries:
+            deleter.delete_result(sensu_host, client, check_name)
+        deleter.close()
+    finally:
+        journal.close()
+    print(deleter.report())
+    api.log_stats()
+    if failed or deleter.failed:
+        sys.exit(1)
+
+
+# Standard boilerplate to call the main() function to begin
+# the program.
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description="Deletes the Sensu results selected by a JSON or YAML "
+                    "rule file.",
+        epilog="See sensu_purge_rules.json for an example rule file"
+    )
+    parser.add_argument(
+        "-s",
+        "--sensu_hosts",
+        type=str,
+        required=False,
+        help="Sensu Host",
+        metavar="sensu_host"
+    )
+    parser.add_argument(
+        "-r",
+        "--rules",
+        type=str,
+        required=False,
+        help="JSON or YAML file with the purge rules",
+        metavar="rules"
+    )
+    parser.add_argument(
+        "-n",
+        "--dry_run",
+        help="only plan the purge into the journal and list it",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "--journal",
+        type=str,
+        required=False,
+        help="File the planned deletes and their progress are kept in",
+        metavar="journal",
+        default="~/.cache/sensu_purge.journal"
+    )
+    parser.add_argument(
+        "--resume",
+        help="continue the purge planned in --journal without fetching "
+             "/results again",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        required=False,
+        help="Completed deletes are recorded in the journal in batches "
+             "of this size",
+        metavar="batch_size",
+        default=100
+    )
+    add_output_arguments(parser)
+    add_api_arguments(parser)
+    add_delete_arguments(parser)
+    loglevel_group = parser.add_mutually_exclusive_group(required=False)
+    loglevel_group.add_argument(
+        "-v",
+        "--verbose",
+        help="increase output verbosity",
+        action="count",
+        default=0)
+    loglevel_group.add_argument(
+        "-q",
+        "--quiet",
+        help="decrease output verbosity",
+        action="count",
+        default=0)
+    args = parser.parse_args()
+
+    # Setup logging
+    # script -vv -> DEBUG
+    # script -v -> INFO
+    # script -> WARNING
+    # script -q -> ERROR
+    # script -qq -> CRITICAL
+    # script -qqq -> no logging at all
+    loglevel = logging.WARNING + 10*args.quiet - 10*args.verbose
+    # Set 'max'/'min' levels for logging
+    if loglevel > 50:
+        loglevel = 50
+    elif loglevel < 10:
+        loglevel = 10
+
+    main(args, loglevel)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+'''
+Run several Sensu result reports over a single pass of /results
+
+The stale, no-TTL, duplicate check and look for checks reports are
+all fed from the same download, so running them together costs one
+API request per host instead of one per report.
+'''
+
+# Import Standard Modules
+import argparse
+import logging
+import sys
+
+try:
+    from sensu_functions import (add_api_arguments,
+                                 add_stale_arguments,
+                                 fetch_results,
+                                 sensu_api,
+                                 sensu_host_fan_out,
+                                 split_list)
+except ImportError:
+    print("Unable to import sensu_functions")
+    sys.exit(3)
+
+try:
+    from sensu_reports import (REPORTS,
+                               DupCheckReport,
+                               FindChecksReport,
+                               StaleReport,
+                               finish_reports,
+                               run_reports,
+                               stream_reports)
+except ImportError:
+    print("Unable to import sensu_reports")
+    sys.exit(3)
+
+try:
+    from sensu_output import DELIMITED_FORMATS, add_output_arguments
+except ImportError:
+    print("Unable to import sensu_output")
+    sys.exit(3)
+
+try:
+    from sensu_delta import (add_delta_arguments,
+                             partial_deltas,
+                             stream_deltas)
+except ImportError:
+    print("Unable to import sensu_delta")
+    sys.exit(3)
+
+try:
+    from sensu_indexer import add_daemon_arguments, reports_via_daemon
+except ImportError:
+    print("Unable to import sensu_indexer")
+    sys.exit(3)
+
+
+def build_reports(args):
+    reports = []
+    for name in [x.strip() for x in args.reports.split(',')]:
+        if name not in REPORTS:
+            print("Unknown report: %s" % name)
+            print("Available reports: %s" % ", ".join(sorted(REPORTS)))
+            sys.exit(3)
+        if REPORTS[name] is FindChecksReport:
+            if not args.check_names and not args.check_prefixes:
+                print("The find report requires --check_names or "
+                      "--check_prefixes")
+                sys.exit(3)
+            reports.append(FindChecksReport(
+                check_names=split_list(args.check_names),
+                prefixes=split_list(args.check_prefixes)))
+        elif REPORTS[name] is DupCheckReport:
+            reports.append(DupCheckReport(show_counts=args.counts))
+        elif REPORTS[name] is StaleReport:
+            reports.append(StaleReport(threshold=args.threshold,
+                                       missed_intervals=args.missed_intervals,
+                                       top=args.top))
+        else:
+            reports.append(REPORTS[name]())
+    return reports
+
+
+# Gather our code in a main() function
+def main(args, loglevel):
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=loglevel)
+
+    sensu_hosts = [x.strip() for x in args.sensu_hosts.split(',')]
+    api = sensu_api(args)
+    reports = build_reports(args)
+    if len(reports) > 1 and args.format in DELIMITED_FORMATS:
+        print("The %s format holds a single report, use -f jsonl to run "
+              "several" % args.format)
+        sys.exit(3)
+
+    if args.delta:
+        stream_deltas(reports, args.format, args.state_dir, sensu_hosts,
+                      label=len(reports) > 1)
+    else:
+        stream_reports(reports, args.format, label=len(reports) > 1)
+    if args.via_daemon:
+        sys.exit(reports_via_daemon(args, sensu_hosts, reports,
+                                    label=len(reports) > 1))
+    hosts = sensu_host_fan_out(api, sensu_hosts, fetch_results, args)
+    for report in run_reports(hosts, reports, columnar=args.columnar):
+        if report.writer is None:
+            print("%s:" % report.name)
+            print(report.render())
+    if hosts.failed:
+        partial_deltas(reports)
+    finish_reports(reports)
+    api.log_stats()
+    if hosts.failed:
+        sys.exit(1)
+
+
+# Standard boilerplate to call the main() function to begin
+# the program.
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description="Runs several Sensu result reports in a single pass.",
+        epilog="Available reports: %s" % ", ".join(sorted(REPORTS))
+    )
+    parser.add_argument(
+        "-s",
+        "--sensu_hosts",
+        type=str,
+        required=True,
+        help="Sensu Host",
+        metavar="sensu_host"
+    )
+    parser.add_argument(
+        "-r",
+        "--reports",
+        type=str,
+        required=False,
+        help="Comma separated list of reports to run",
+        metavar="reports",
+        default="stale,no_ttl,dup"
+    )
+    parser.add_argument(
+        "-c",
+        "--check_names",
+        type=str,
+        required=False,
+        help="Comma separated check names looked for by the find report",
+        metavar="check_names"
+    )
+    parser.add_argument(
+        "-p",
+        "--check_prefixes",
+        type=str,
+        required=False,
+        help="Comma separated per-client check prefixes looked for by the "
+             "find report, e.g. CPU_Metrics_on_ matches "
+             "CPU_Metrics_on_<client>",
+        metavar="check_prefixes"
+    )
+    add_stale_arguments(parser)
+    parser.add_argument(
+        "--counts",
+        help="show per client and per Sensu host counts in the dup report",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "--columnar",
+        help="load each host's results into a compact columnar store "
+             "before running the reports",
+        action="store_true",
+        default=False
+    )
+    add_output_arguments(parser)
+    add_daemon_arguments(parser)
+    add_delta_arguments(parser)
+    add_api_arguments(parser)
+    loglevel_group = parser.add_mutually_exclusive_group(required=False)
+    loglevel_group.add_argument(
+        "-v",
+        "--verbose",
+        help="increase output verbosity",
+        action="count",
+        default=0)
+    loglevel_group.add_argument(
+        "-q",
+        "--quiet",
+        help="decrease output verbosity",
+        action="count",
+        default=0)
+    args = parser.parse_args()
+
+    # Setup logging
+    # script -vv -> DEBUG
+    # script -v -> INFO
+    # script -> WARNING
+    # script -q -> ERROR
+    # script -qq -> CRITICAL
+    # script -qqq -> no logging at all
+    loglevel = logging.WARNING + 10*args.quiet - 10*args.verbose
+    # Set 'max'/'min' levels for logging
+    if loglevel > 50:
+        loglevel = 50
+    elif loglevel < 10:
+        loglevel = 10
+
+    main(args, loglevel)
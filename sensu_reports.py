@@ -0,0 +1,512 @@
+#!/usr/bin/env python
+'''
+Reports run over the Sensu /results collection
+
+Each report is an incremental accumulator: run_reports walks the
+results once and hands every result to all of the selected reports,
+so several reports cost a single download and a single pass.
+'''
+
+# Import Standard Modules
+import datetime
+import heapq
+import re
+import sys
+import time
+
+try:
+    from itertools import izip as zip
+except ImportError:
+    pass
+
+# NumPy is optional, the stale report falls back to a Python loop
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from prettytable import PrettyTable
+except ImportError:
+    print("Please install prettytable:")
+    print("$ sudo pip install prettytable")
+    sys.exit(3)
+
+try:
+    from sensu_matchers import CheckMatcher
+except ImportError:
+    print("Unable to import sensu_matchers")
+    sys.exit(3)
+
+try:
+    from sensu_store import ResultStore
+except ImportError:
+    print("Unable to import sensu_store")
+    sys.exit(3)
+
+try:
+    from sensu_output import row_writer
+except ImportError:
+    print("Unable to import sensu_output")
+    sys.exit(3)
+
+
+class Report(object):
+    name = None
+    fields = []
+    # Leading fields that identify a row, used by the delta mode
+    key_fields = ['Client']
+    # Fields that move with the clock, the delta mode does not compare them
+    volatile_fields = []
+    writer = None
+
+    def stream_to(self, writer):
+        # Rows are handed to `writer` as soon as they are final instead
+        # of being kept for render(), flush() writes whatever is left
+        self.writer = writer
+
+    def flush(self):
+        pass
+
+    def add(self, sensu_host, result):
+        raise NotImplementedError
+
+    def add_store(self, sensu_host, store):
+        # Reports override this to read the ResultStore columns directly
+        for result in store.records():
+            self.add(sensu_host, result)
+
+    def render(self):
+        raise NotImplementedError
+
+
+class StaleReport(Report):
+    '''
+    Checks that last executed more than `threshold` seconds before a
+    single reference time. Timestamps are only formatted for the rows
+    that end up in the report.
+
+    With `missed_intervals` a check with an interval is stale once it
+    missed more than that many of its own intervals, checks without an
+    interval keep using `threshold`, and are ranked by drift in units
+    of `threshold` so both kinds compare in the same unit. With `top`
+    only the K stalest checks are kept, in a bounded heap.
+    '''
+    name = 'stale'
+    key_fields = ['Client', 'Check Name']
+    volatile_fields = ['Missed Intervals']
+
+    @property
+    def fields(self):
+        fields = ['Client', 'Check Name', 'Last Execution']
+        if self.missed_intervals is not None:
+            fields.append('Missed Intervals')
+        return fields
+
+    def __init__(self, threshold=14400, current_time=None,
+                 missed_intervals=None, top=None):
+        self.threshold = threshold
+        self.current_time = current_time or time.time()
+        self.missed_intervals = missed_intervals
+        if top is not None and top < 1:
+            raise ValueError("top must be at least 1")
+        self.top = top
+        self.rows = []
+        self._count = 0
+
+    def add(self, sensu_host, result):
+        check = result['check']
+        self.add_check(result['client'], check['name'],
+                       int(check['executed']),
+                       int(check.get('interval') or 0))
+
+    def add_store(self, sensu_host, store):
+        if numpy is None or not len(store):
+            for row in zip(store.client, store.check_name,
+                           store.executed, store.interval):
+                self.add_check(*row)
+            return
+        executed = numpy.frombuffer(store.executed,
+                                    dtype='i%d' % store.executed.itemsize)
+        drift = self.current_time - executed
+        if self.missed_intervals is None:
+            score = drift
+            stale = drift > self.threshold
+        else:
+            interval = numpy.frombuffer(
+                store.interval, dtype='i%d' % store.interval.itemsize)
+            has_interval = interval > 0
+            score = numpy.where(has_interval,
+                                drift / numpy.maximum(interval, 1),
+                                drift / float(max(self.threshold, 1)))
+            stale = numpy.where(has_interval,
+                                score > self.missed_intervals,
+                                drift > self.threshold)
+        for index in numpy.flatnonzero(stale):
+            self.add_row(float(score[index]), store.client[index],
+                         store.check_name[index], int(executed[index]),
+                         store.interval[index])
+
+    def add_check(self, client, check_name, executed, interval=0):
+        drift = (self.current_time - executed)
+        if self.missed_intervals is not None and interval > 0:
+            score = drift / float(interval)
+            if score > self.missed_intervals:
+                self.add_row(score, client, check_name, executed, interval)
+        elif drift > self.threshold:
+            score = drift
+            if self.missed_intervals is not None:
+                score = drift / float(max(self.threshold, 1))
+            self.add_row(score, client, check_name, executed, interval)
+
+    def add_row(self, score, client, check_name, executed, interval):
+        self._count += 1
+        row = (score, self._count, client, check_name, executed, interval)
+        if self.top is None:
+            if self.writer is not None:
+                self.writer.row(self.output_row(row))
+            else:
+                self.rows.append(row)
+        elif len(self.rows) < self.top:
+            heapq.heappush(self.rows, row)
+        elif score > self.rows[0][0]:
+            heapq.heapreplace(self.rows, row)
+
+    def sorted_rows(self):
+        if self.top is not None:
+            return sorted(self.rows, reverse=True)
+        return self.rows
+
+    def output_row(self, row):
+        score, _, client, check_name, executed, interval = row
+        real_time = datetime.datetime.fromtimestamp(
+            int(executed)).strftime('%Y-%m-%d %H:%M:%S')
+        values = [client, check_name, real_time]
+        if self.missed_intervals is not None:
+            values.append(int(score) if interval else '')
+        return values
+
+    def flush(self):
+        for row in self.sorted_rows():
+            self.writer.row(self.output_row(row))
+        self.rows = []
+
+    def render(self):
+        table = PrettyTable(self.fields)
+        for row in self.sorted_rows():
+            table.add_row(self.output_row(row))
+        return table.get_string()
+
+
+class NoTTLReport(Report):
+    name = 'no_ttl'
+    fields = ['Client', 'Check Name']
+    key_fields = ['Client', 'Check Name']
+
+    def __init__(self):
+        self.rows = []
+
+    def add(self, sensu_host, result):
+        self.add_check(result['client'], result['check']['name'],
+                       'ttl' in result['check'])
+
+    def add_store(self, sensu_host, store):
+        for client, check_name, has_ttl in zip(store.client,
+                                               store.check_name,
+                                               store.has_ttl):
+            self.add_check(client, check_name, has_ttl)
+
+    def add_check(self, client, check_name, has_ttl):
+        if not has_ttl:
+            if check_name != 'keepalive':
+                if self.writer is not None:
+                    self.writer.row([client, check_name])
+                else:
+                    self.rows.append([client, check_name])
+
+    def render(self):
+        table = PrettyTable(self.fields)
+        for row in self.rows:
+            table.add_row(row)
+        return table.get_string()
+
+
+class DupCheckReport(Report):
+    '''
+    Clients running a per-client check (name containing "on_") that
+    they also originate. Clients are tracked in a set and counted per
+    client and per Sensu host, the table is only built by render().
+    '''
+    name = 'dup'
+
+    @property
+    def fields(self):
+        if self.show_counts:
+            return ['Client', 'Duplicate Checks']
+        return ['Client']
+
+    def __init__(self, show_counts=False):
+        self.show_counts = show_counts
+        self.clients = []
+        self.client_counts = {}
+        self.host_counts = {}
+
+    @property
+    def total_count(self):
+        return len(self.clients)
+
+    def add(self, sensu_host, result):
+        check = result['check']
+        self.add_check(sensu_host, result['client'], check['name'],
+                       check.get('origin'))
+
+    def add_store(self, sensu_host, store):
+        for client, check_name, origin in zip(store.client,
+                                              store.check_name,
+                                              store.origin):
+            self.add_check(sensu_host, client, check_name, origin)
+
+    def add_check(self, sensu_host, client, check_name, origin):
+        if origin is not None:
+            if 'on_' in check_name and origin == client:
+                if check_name != 'keepalive':
+                    if client not in self.client_counts:
+                        self.clients.append(client)
+                        self.client_counts[client] = 0
+                        if self.writer is not None and not self.show_counts:
+                            self.writer.row([client])
+                    self.client_counts[client] += 1
+                    self.host_counts[sensu_host] = \
+                        self.host_counts.get(sensu_host, 0) + 1
+
+    def flush(self):
+        # Counts are only final once every result was seen
+        if self.show_counts:
+            for client in self.clients:
+                self.writer.row([client, self.client_counts[client]])
+
+    def render(self):
+        if self.show_counts:
+            table = PrettyTable(['Client', 'Duplicate Checks'])
+            for client in self.clients:
+                table.add_row([client, self.client_counts[client]])
+        else:
+            table = PrettyTable(['Client'])
+            for client in self.clients:
+                table.add_row([client])
+        output = "%s\n%s" % (table.get_string(), self.total_count)
+        if self.show_counts:
+            hosts = PrettyTable(['Sensu Host', 'Duplicate Checks'])
+            for sensu_host in sorted(self.host_counts):
+                hosts.add_row([sensu_host, self.host_counts[sensu_host]])
+            output = "%s\n%s" % (output, hosts.get_string())
+        return output
+
+
+class FindChecksReport(Report):
+    name = 'find'
+    fields = ['Client']
+
+    def __init__(self, check_names=(), prefixes=()):
+        self.matcher = CheckMatcher(names=check_names, prefixes=prefixes)
+        self.clients = set()
+
+    def add(self, sensu_host, result):
+        self.add_check(result['client'], result['check']['name'])
+
+    def add_store(self, sensu_host, store):
+        for client, check_name in zip(store.client, store.check_name):
+            self.add_check(client, check_name)
+
+    def add_index(self, index):
+        # Answered from a CheckIndex instead of a /results pass
+        for client in sorted(index.find(self.matcher.names,
+                                        self.matcher.prefixes)):
+            self.add_client(client)
+
+    def add_check(self, client, check_name):
+        if client not in self.clients:
+            if self.matcher.match(client, check_name):
+                self.add_client(client)
+
+    def add_client(self, client):
+        if client not in self.clients:
+            self.clients.add(client)
+            if self.writer is not None:
+                self.writer.row([client])
+
+    def render(self):
+        return "\n".join(sorted(self.clients))
+
+
+class ClientListReport(Report):
+    # Sensu client names, fed from /clients
+    name = 'clients'
+    fields = ['Client']
+
+    def __init__(self):
+        self.clients = []
+
+    def add(self, sensu_host, client):
+        if self.writer is not None:
+            self.writer.row([client['name']])
+        else:
+            self.clients.append(client['name'])
+
+    def render(self):
+        return "\n".join("%s," % x for x in self.clients)
+
+
+def version_key(version):
+    # Compare versions numerically so 0.26.10 sorts after 0.26.5
+    return [int(x) for x in re.findall(r'\d+', version)]
+
+
+def histogram(counts, width=40):
+    peak = max(counts.values())
+    lines = []
+    for version in sorted(counts, key=version_key):
+        bar = '#' * max(1, int(round(width * counts[version] / float(peak))))
+        lines.append("%-16s %8d %s" % (version, counts[version], bar))
+    return "\n".join(lines)
+
+
+class ClientVersionReport(Report):
+    '''
+    Sensu client versions, fed from /clients rather than /results.
+
+    With `target_version` only clients running an older version are
+    included, `batch_size` numbers them in upgrade batches. With
+    `aggregate` only one counter per version and per Sensu host is
+    kept, rendered as a histogram.
+    '''
+    name = 'versions'
+
+    @property
+    def fields(self):
+        if self.aggregate:
+            return ['Sensu Host', 'Version', 'Clients']
+        if self.batch_size:
+            return ['Client', 'Version', 'Batch']
+        return ['Client', 'Version']
+
+    def __init__(self, aggregate=False, target_version=None,
+                 batch_size=None):
+        self.aggregate = aggregate
+        self.target = None
+        if target_version:
+            self.target = version_key(target_version)
+        self.batch_size = batch_size
+        self.total_count = 0
+        self.rows = []
+        self.hosts = []
+        self.version_counts = {}
+        self.host_counts = {}
+
+    def add(self, sensu_host, client):
+        version = client['version']
+        if self.target is not None and version_key(version) >= self.target:
+            return
+        self.total_count += 1
+        if self.aggregate:
+            if sensu_host not in self.host_counts:
+                self.hosts.append(sensu_host)
+                self.host_counts[sensu_host] = {}
+            self.version_counts[version] = \
+                self.version_counts.get(version, 0) + 1
+            counts = self.host_counts[sensu_host]
+            counts[version] = counts.get(version, 0) + 1
+            return
+        row = [client['name'], version]
+        if self.batch_size:
+            row.append((self.total_count - 1) // self.batch_size + 1)
+        if self.writer is not None:
+            self.writer.row(row)
+        else:
+            self.rows.append(row)
+
+    def host_rows(self):
+        for sensu_host in self.hosts:
+            counts = self.host_counts[sensu_host]
+            for version in sorted(counts, key=version_key):
+                yield [sensu_host, version, counts[version]]
+
+    def flush(self):
+        if self.aggregate:
+            for row in self.host_rows():
+                self.writer.row(row)
+
+    def render(self):
+        table = PrettyTable(self.fields)
+        if self.aggregate:
+            for row in self.host_rows():
+                table.add_row(row)
+            output = "%s\n%s" % (table, self.total_count)
+            if self.version_counts:
+                output = "%s\n%s" % (histogram(self.version_counts), output)
+            return output
+        for row in self.rows:
+            table.add_row(row)
+        if self.batch_size:
+            return "%s\n%s" % (table, self.total_count)
+        return "%s\n%s" % (table.get_string(sortby="Version"),
+                            self.total_count)
+
+
+REPORTS = dict((x.name, x) for x in [
+    StaleReport,
+    NoTTLReport,
+    DupCheckReport,
+    FindChecksReport,
+])
+
+
+def missing_check_clients(clients, results, check_name):
+    '''
+    Hash anti-join of client names against /results, returns the
+    clients that have no result for check_name in client order
+    '''
+    have = set()
+    for result in results:
+        if result['check']['name'] == check_name:
+            have.add(result['client'])
+    return [x for x in clients if x not in have]
+
+
+def orphaned_results(clients, results):
+    '''
+    Hash join of /results against a set of client names, yields the
+    results whose client no longer exists
+    '''
+    for result in results:
+        if result['client'] not in clients:
+            yield result
+
+
+def stream_reports(reports, fmt, label=False):
+    # Attach a streaming writer to every report unless fmt is table
+    for report in reports:
+        writer = row_writer(fmt, report.fields,
+                            label=report.name if label else None)
+        if writer is not None:
+            report.stream_to(writer)
+
+
+def finish_reports(reports):
+    for report in reports:
+        if report.writer is not None:
+            report.flush()
+            report.writer.close()
+
+
+def run_reports(hosts, reports, columnar=False):
+    for sensu_host, values in hosts:
+        if columnar:
+            store = ResultStore().extend(values)
+            for report in reports:
+                report.add_store(sensu_host, store)
+            continue
+        for result in values:
+            for report in reports:
+                report.add(sensu_host, result)
+    return reports
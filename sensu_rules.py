@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+'''
+Declarative purge rules for Sensu results
+
+A rule file (JSON, or YAML when PyYAML is installed) holds a list of
+rules, each selecting check names and optionally narrowing them down by
+age and status:
+
+    {"rules": [
+        {"name": "base playbook metrics",
+         "templates": ["CPU_Metrics_on_<client>"],
+         "names": ["CPU_Metrics"],
+         "prefixes": ["DNS_"],
+         "regexes": ["^check_ping[46]_"],
+         "older_than": "7d",
+         "status": [1, 2]}
+    ]}
+
+A rule without any name, prefix, template or regex is rejected, a
+rule for every check has to say so with "all_checks": true. RuleSet
+compiles all rules into lookup tables, so one pass over /results costs
+about the same for hundreds of rules as for one.
+'''
+
+# Import Standard Modules
+import json
+import re
+import sys
+import time
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+try:
+    from sensu_matchers import CLIENT, CheckMatcher
+except ImportError:
+    print("Unable to import sensu_matchers")
+    sys.exit(3)
+
+RULE_KEYS = frozenset(['name', 'names', 'prefixes', 'templates', 'regexes',
+                       'all_checks', 'older_than', 'status'])
+DURATION = re.compile(r'^\s*(\d+)\s*([smhdw]?)\s*$')
+UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_duration(value):
+    # Seconds from 3600, "3600", "90m", "12h" or "7d"
+    if isinstance(value, int):
+        return value
+    match = DURATION.match(str(value))
+    if not match:
+        raise ValueError("invalid duration: %r" % value)
+    return int(match.group(1)) * UNITS[match.group(2)]
+
+
+def as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+class PurgeRule(object):
+
+    def __init__(self, name, names=(), prefixes=(), templates=(),
+                 regexes=(), all_checks=False, older_than=None, status=None):
+        self.name = name
+        self.names = as_list(names)
+        self.prefixes = as_list(prefixes)
+        self.templates = []
+        for template in as_list(templates):
+            if not template.endswith(CLIENT):
+                raise ValueError("rule %s: template %r does not end with "
+                                 "%s" % (name, template, CLIENT))
+            self.templates.append(template[:-len(CLIENT)])
+        self.regexes = [re.compile(x) for x in as_list(regexes)]
+        self.older_than = None
+        if older_than is not None:
+            self.older_than = parse_duration(older_than)
+        self.status = None
+        if status is not None:
+            self.status = frozenset(int(x) for x in as_list(status))
+        selects = (self.names or self.prefixes or self.templates or
+                   self.regexes)
+        if all_checks and selects:
+            raise ValueError("rule %s: all_checks cannot be combined with "
+                             "names, prefixes, templates or regexes" % name)
+        if not all_checks and not selects:
+            # An empty list must never widen into a purge of everything
+            raise ValueError("rule %s selects no checks, set all_checks "
+                             "to match every check" % name)
+        self.any_check = bool(all_checks)
+        self.unconditional = self.older_than is None and self.status is None
+
+    @classmethod
+    def from_dict(cls, number, values):
+        unknown = set(values) - RULE_KEYS
+        name = values.get('name', '#%s' % number)
+        if unknown:
+            raise ValueError("rule %s: unknown keys %s" %
+                             (name, ", ".join(sorted(unknown))))
+        options = dict((str(k), v) for k, v in values.items() if k != 'name')
+        return cls(name, **options)
+
+    def accepts(self, check, now):
+        # The age and status conditions, once the check name matched
+        if self.older_than is not None:
+            if now - int(check.get('executed') or 0) <= self.older_than:
+                return False
+        if self.status is not None:
+            if int(check.get('status') or 0) not in self.status:
+                return False
+        return True
+
+
+class RuleSet(object):
+    '''
+    All rules compiled into one matcher. Exact names and templates are
+    dictionary lookups, prefixes one lookup per distinct prefix length,
+    and regexes without groups are joined into a single pattern that
+    only has to fail once for names no rule selects by regex. The rules
+    selected by a check name without a template are cached per name,
+    in the order of the rule file.
+    '''
+
+    cache_size = 100000
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        # Position of every rule in the file, the first match wins
+        self.position = dict((id(x), i) for i, x in enumerate(self.rules))
+        self.names = {}
+        self.prefixes = {}
+        self.templates = {}
+        self.regex_rules = []
+        self.any_check = []
+        for rule in self.rules:
+            for name in rule.names:
+                self.names.setdefault(name, []).append(rule)
+            for prefix in rule.prefixes:
+                self.prefixes.setdefault(len(prefix), {}).setdefault(
+                    prefix, []).append(rule)
+            for prefix in rule.templates:
+                self.templates.setdefault(prefix, []).append(rule)
+            if rule.regexes:
+                self.regex_rules.append(rule)
+            if rule.any_check:
+                self.any_check.append(rule)
+        self.regex = None
+        patterns = [x for rule in self.regex_rules for x in rule.regexes]
+        # Joining renumbers the groups, which breaks backreferences
+        if patterns and not any(x.groups for x in patterns):
+            try:
+                self.regex = re.compile('|'.join(
+                    '(?:%s)' % x.pattern for x in patterns))
+            except (re.error, AssertionError):
+                # Not valid as one pattern, test them one by one
+                self.regex = None
+        self.splitter = CheckMatcher()
+        self._static = {}
+
+    def __len__(self):
+        return len(self.rules)
+
+    def rule_position(self, rule):
+        return self.position[id(rule)]
+
+    def static_rules(self, check_name):
+        rules = self._static.get(check_name)
+        if rules is not None:
+            return rules
+        rules = list(self.any_check)
+        rules.extend(self.names.get(check_name, ()))
+        for length, prefixes in self.prefixes.items():
+            rules.extend(prefixes.get(check_name[:length], ()))
+        if self.regex_rules and (self.regex is None or
+                                 self.regex.search(check_name)):
+            rules.extend(x for x in self.regex_rules
+                         if any(r.search(check_name) for r in x.regexes))
+        rules = tuple(sorted(set(rules), key=self.rule_position))
+        if len(self._static) >= self.cache_size:
+            self._static.clear()
+        self._static[check_name] = rules
+        return rules
+
+    def match(self, client, check, now=None):
+        '''
+        Returns the first rule in file order selecting this result, or
+        None
+        '''
+        check_name = check['name']
+        now = now or time.time()
+        rules = self.static_rules(check_name)
+        prefix, check_client = self.splitter.split(client, check_name)
+        if check_client is not None and prefix in self.templates:
+            rules = sorted(rules + tuple(self.templates[prefix]),
+                           key=self.rule_position)
+        for rule in rules:
+            if rule.unconditional:
+                return rule
+            if rule.accepts(check, now):
+                return rule
+        return None
+
+
+def load_rules(path):
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise ValueError("%s: please install PyYAML to read YAML "
+                                 "rules" % path)
+            document = yaml.safe_load(f)
+        else:
+            document = json.load(f)
+    if isinstance(document, dict):
+        document = document.get('rules', [])
+    return RuleSet(PurgeRule.from_dict(number, values)
+                   for number, values in enumerate(document, 1))
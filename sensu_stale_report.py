@@ -7,33 +7,45 @@ Add some documentation here
 import argparse
 import logging
 import sys
-import json
-import time
-import datetime
 
 try:
-    import requests
+    from sensu_functions import (add_api_arguments,
+                                 add_stale_arguments,
+                                 fetch_results,
+                                 sensu_api,
+                                 sensu_host_fan_out)
 except ImportError:
-    print "Please install requests"
-    print "$ sudo pip install request"
+    print "Unable to import sensu_functions"
     sys.exit(3)
 
 try:
-    from prettytable import PrettyTable
+    from sensu_reports import (StaleReport,
+                               finish_reports,
+                               run_reports,
+                               stream_reports)
 except ImportError:
-    print "Please install prettytable:"
-    print "$ sudo pip install prettytable"
+    print "Unable to import sensu_reports"
     sys.exit(3)
 
+try:
+    from sensu_output import add_output_arguments
+except ImportError:
+    print "Unable to import sensu_output"
+    sys.exit(3)
 
-def sensu_results(sensu_host):
-    url = "https://%s/results" % sensu_host
-    try:
-        r = requests.get(url, timeout=5.0, verify=False)
-        return r.text
-    except requests.exceptions.RequestException as e:
-        print e
-        sys.exit(1)
+try:
+    from sensu_delta import (add_delta_arguments,
+                             partial_deltas,
+                             stream_deltas)
+except ImportError:
+    print "Unable to import sensu_delta"
+    sys.exit(3)
+
+try:
+    from sensu_indexer import add_daemon_arguments, reports_via_daemon
+except ImportError:
+    print "Unable to import sensu_indexer"
+    sys.exit(3)
 
 
 # Gather our code in a main() function
@@ -41,34 +53,27 @@ def main(args, loglevel):
     logging.basicConfig(format="%(levelname)s: %(message)s", level=loglevel)
 
     sensu_hosts = [x.strip() for x in args.sensu_hosts.split(',')]
-
-    # try:
-    #     r = requests.get("https://sensu.dc4.arin.net/results", verify=False)
-    # except requests.exceptions.RequestException as e:
-    #     print e
-    #     sys.exit(1)
-
-    t = PrettyTable(['Client', 'Check Name', 'Last Execution'])
-    for sensu_host in sensu_hosts:
-        r = sensu_results(sensu_host)
-
-        values = json.loads(r)
-
-        for index in values:
-            client = index['client']
-            check_name = index['check']['name']
-            executed = int(index['check']['executed'])
-            current_time = time.time()
-            drift = (current_time - executed)
-            if drift > 14400:
-                real_time = datetime.datetime.fromtimestamp(
-                    int(executed)).strftime('%Y-%m-%d %H:%M:%S')
-                t.add_row([
-                    client,
-                    check_name,
-                    real_time
-                ])
-    print t
+    api = sensu_api(args)
+
+    report = StaleReport(threshold=args.threshold,
+                         missed_intervals=args.missed_intervals,
+                         top=args.top)
+    if args.delta:
+        stream_deltas([report], args.format, args.state_dir, sensu_hosts)
+    else:
+        stream_reports([report], args.format)
+    if args.via_daemon:
+        sys.exit(reports_via_daemon(args, sensu_hosts, [report]))
+    hosts = sensu_host_fan_out(api, sensu_hosts, fetch_results, args)
+    run_reports(hosts, [report], columnar=True)
+    if report.writer is None:
+        print report.render()
+    if hosts.failed:
+        partial_deltas([report])
+    finish_reports([report])
+    api.log_stats()
+    if hosts.failed:
+        sys.exit(1)
 
 # Standard boilerplate to call the main() function to begin
 # the program.
@@ -87,6 +92,11 @@ if __name__ == '__main__':
         help="Sensu Host",
         metavar="sensu_host"
     )
+    add_stale_arguments(parser)
+    add_output_arguments(parser)
+    add_daemon_arguments(parser)
+    add_delta_arguments(parser)
+    add_api_arguments(parser)
     loglevel_group = parser.add_mutually_exclusive_group(required=False)
     loglevel_group.add_argument(
         "-v",
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+'''
+Compact columnar storage for Sensu results
+
+Only the fields the reports read are kept: one list or typed array per
+field, with repeated strings (client and check names, origins) shared
+through an intern table. A result dict can be dropped as soon as it has
+been added, so with --stream the full object tree never exists.
+'''
+
+# Import Standard Modules
+from array import array
+
+
+class ResultStore(object):
+
+    def __init__(self):
+        self._strings = {}
+        self.client = []
+        self.check_name = []
+        self.origin = []
+        self.executed = array('l')
+        self.status = array('i')
+        self.interval = array('l')
+        self.has_ttl = array('b')
+
+    def __len__(self):
+        return len(self.client)
+
+    def intern(self, value):
+        if value is None:
+            return None
+        return self._strings.setdefault(value, value)
+
+    def add(self, result):
+        check = result['check']
+        self.client.append(self.intern(result['client']))
+        self.check_name.append(self.intern(check['name']))
+        self.origin.append(self.intern(check.get('origin')))
+        self.executed.append(int(check.get('executed') or 0))
+        self.status.append(int(check.get('status') or 0))
+        self.interval.append(int(check.get('interval') or 0))
+        self.has_ttl.append(1 if 'ttl' in check else 0)
+
+    def extend(self, results):
+        for result in results:
+            self.add(result)
+        return self
+
+    def record(self, index):
+        # Rebuild a result in the /results shape from the stored columns
+        check = {
+            'name': self.check_name[index],
+            'executed': self.executed[index],
+            'status': self.status[index],
+        }
+        if self.interval[index]:
+            check['interval'] = self.interval[index]
+        if self.origin[index] is not None:
+            check['origin'] = self.origin[index]
+        if self.has_ttl[index]:
+            check['ttl'] = True
+        return {'client': self.client[index], 'check': check}
+
+    def records(self):
+        for index in range(len(self)):
+            yield self.record(index)
@@ -0,0 +1,519 @@
+#!/usr/bin/env python
+'''
+Single entry point for the Sensu reports and purges
+
+    sensu_tool.py -s sensu1,sensu2 stale -t 3600 + no-ttl + dup --counts
+
+Commands separated by "+" run in one process. Each Sensu collection is
+downloaded once per host and shared by every command that needs it,
+and neighbouring /results reports (stale, no-ttl, dup, find) run in a
+single pass. Modules only some commands need, like prettytable and
+numpy, are imported when such a command runs.
+'''
+
+# Import Standard Modules
+import argparse
+import logging
+import sys
+
+try:
+    from sensu_functions import (add_api_arguments,
+                                 add_delete_arguments,
+                                 add_orphan_arguments,
+                                 add_stale_arguments,
+                                 fetch_clients,
+                                 fetch_results,
+                                 positive_int,
+                                 sensu_api,
+                                 sensu_bulk_delete,
+                                 sensu_host_fan_out,
+                                 split_list)
+except ImportError:
+    print("Unable to import sensu_functions")
+    sys.exit(3)
+
+try:
+    from sensu_output import (DELIMITED_FORMATS,
+                              add_output_arguments,
+                              row_writer)
+except ImportError:
+    print("Unable to import sensu_output")
+    sys.exit(3)
+
+FETCH = {
+    '/results': fetch_results,
+    '/clients': fetch_clients,
+}
+
+
+class Session(object):
+    '''
+    The Sensu collections of one run. A collection used by a single
+    command is streamed to it, one used by several is kept in memory
+    after the first download.
+    '''
+
+    def __init__(self, api, sensu_hosts, args, uses):
+        self.api = api
+        self.sensu_hosts = sensu_hosts
+        self.args = args
+        self.uses = uses
+        self.fan_outs = []
+        self.collections = {}
+
+    def collection(self, endpoint):
+        if endpoint in self.collections:
+            return self.collections[endpoint]
+        hosts = sensu_host_fan_out(self.api, self.sensu_hosts,
+                                   FETCH[endpoint], self.args)
+        self.fan_outs.append(hosts)
+        if self.uses.get(endpoint, 0) < 2:
+            return hosts
+        self.collections[endpoint] = [(x, list(values))
+                                      for x, values in hosts]
+        return self.collections[endpoint]
+
+    @property
+    def failed(self):
+        return [x for hosts in self.fan_outs for x in hosts.failed]
+
+
+def print_reports(reports, label):
+    from sensu_reports import finish_reports
+    for report in reports:
+        if report.writer is None:
+            if label:
+                print("%s:" % report.name)
+            print(report.render())
+    finish_reports(reports)
+
+
+def build_stale(args):
+    from sensu_reports import StaleReport
+    return StaleReport(threshold=args.threshold,
+                       missed_intervals=args.missed_intervals, top=args.top)
+
+
+def build_no_ttl(args):
+    from sensu_reports import NoTTLReport
+    return NoTTLReport()
+
+
+def build_dup(args):
+    from sensu_reports import DupCheckReport
+    return DupCheckReport(show_counts=args.counts)
+
+
+def build_find(args):
+    from sensu_reports import FindChecksReport
+    if not args.check_names and not args.check_prefixes:
+        print("find requires --check_names or --check_prefixes")
+        sys.exit(3)
+    return FindChecksReport(check_names=split_list(args.check_names),
+                            prefixes=split_list(args.check_prefixes))
+
+
+def run_result_reports(session, commands, label):
+    from sensu_reports import run_reports, stream_reports
+    reports = [REPORT_BUILDERS[x.command](x) for x in commands]
+    stream_reports(reports, commands[0].format, label=label)
+    run_reports(session.collection('/results'), reports,
+                columnar=commands[0].columnar)
+    print_reports(reports, label)
+    return True
+
+
+def run_versions(session, args, label):
+    from sensu_reports import ClientVersionReport, stream_reports
+    report = ClientVersionReport(aggregate=args.aggregate,
+                                 target_version=args.target_version,
+                                 batch_size=args.batch_size)
+    stream_reports([report], args.format, label=label)
+    for sensu_host, values in session.collection('/clients'):
+        for client in values:
+            report.add(sensu_host, client)
+    print_reports([report], label)
+    return True
+
+
+def run_clients(session, args, label):
+    total_count = 0
+    writer = row_writer(args.format, ['Client'],
+                        label='clients' if label else None)
+    for sensu_host, values in session.collection('/clients'):
+        for client in values:
+            total_count += 1
+            if writer is not None:
+                writer.row([client['name']])
+            else:
+                print("%s," % client['name'])
+    if writer is not None:
+        writer.close()
+    else:
+        print("Total Client Count: %s" % total_count)
+    return True
+
+
+def run_missing(session, args, label):
+    from sensu_reports import missing_check_clients
+    clients = dict((x, [y['name'] for y in values])
+                   for x, values in session.collection('/clients'))
+    writer = row_writer(args.format, ['Client'],
+                        label='missing' if label else None)
+    if writer is None:
+        from prettytable import PrettyTable
+        table = PrettyTable(['Client'])
+    for sensu_host, values in session.collection('/results'):
+        if sensu_host not in clients:
+            continue
+        for client in missing_check_clients(clients[sensu_host], values,
+                                            args.check_name):
+            if writer is not None:
+                writer.row([client])
+            else:
+                table.add_row([client])
+    if writer is not None:
+        writer.close()
+    else:
+        if label:
+            print("missing:")
+        print(table)
+    return True
+
+
+def run_orphans(session, args, label):
+    from sensu_reports import orphaned_results
+    clients = dict((x, set(y['name'] for y in values))
+                   for x, values in session.collection('/clients'))
+    deleter = None
+    if args.purge:
+        deleter = sensu_bulk_delete(session.api, args)
+    fields = ['Sensu Host', 'Client', 'Check Name']
+    writer = row_writer(args.format, fields,
+                        label='orphans' if label else None)
+    if writer is None:
+        from prettytable import PrettyTable
+        table = PrettyTable(fields)
+    ok = True
+    for sensu_host, values in session.collection('/results'):
+        if sensu_host not in clients:
+            continue
+        if not clients[sensu_host]:
+            logging.error("%s: /clients is empty, not looking for orphans"
+                          % sensu_host)
+            ok = False
+            continue
+        orphans = orphaned_results(clients[sensu_host], values)
+        if deleter is not None:
+            from sensu_orphaned_results import confirm_orphans
+            import requests
+            try:
+                orphans = confirm_orphans(session.api, sensu_host,
+                                          list(orphans),
+                                          len(clients[sensu_host]),
+                                          args.max_orphan_ratio, args.force)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logging.error("%s: %s" % (sensu_host, e))
+                ok = False
+                continue
+        for result in orphans:
+            client = result['client']
+            check_name = result['check']['name']
+            if deleter is not None:
+                deleter.delete_result(sensu_host, client, check_name)
+            elif writer is not None:
+                writer.row([sensu_host, client, check_name])
+            else:
+                table.add_row([sensu_host, client, check_name])
+    if deleter is not None:
+        deleter.close()
+        print(deleter.report())
+        return ok and not deleter.failed
+    if writer is not None:
+        writer.close()
+    else:
+        if label:
+            print("orphans:")
+        print(table)
+    return ok
+
+
+def purge_matcher(args):
+    # A function telling whether a result is purged, from --rules or
+    # from the check names and prefixes
+    if args.rules:
+        from sensu_rules import load_rules
+        try:
+            rules = load_rules(args.rules)
+        except (IOError, ValueError) as e:
+            print("Unable to load %s: %s" % (args.rules, e))
+            sys.exit(3)
+        return lambda client, check: rules.match(client, check) is not None
+    from sensu_matchers import CheckMatcher
+    if not args.check_names and not args.check_prefixes:
+        print("purge requires --rules, --check_names or --check_prefixes")
+        sys.exit(3)
+    matcher = CheckMatcher(names=split_list(args.check_names),
+                           prefixes=split_list(args.check_prefixes))
+    return lambda client, check: matcher.match(client, check['name'])
+
+
+def run_purge(session, args, label):
+    match = purge_matcher(args)
+    deleter = None if args.dry_run else sensu_bulk_delete(session.api, args)
+    for sensu_host, values in session.collection('/results'):
+        for result in values:
+            client = result['client']
+            check_name = result['check']['name']
+            if match(client, result['check']):
+                if deleter is None:
+                    print("%s %s %s" % (sensu_host, client, check_name))
+                else:
+                    deleter.delete_result(sensu_host, client, check_name)
+    if deleter is None:
+        return True
+    deleter.close()
+    print(deleter.report())
+    return not deleter.failed
+
+
+REPORT_BUILDERS = {
+    'stale': build_stale,
+    'no-ttl': build_no_ttl,
+    'dup': build_dup,
+    'find': build_find,
+}
+
+# Commands other than the /results reports, with the collections they use
+COMMANDS = {
+    'versions': (run_versions, ['/clients']),
+    'clients': (run_clients, ['/clients']),
+    'missing': (run_missing, ['/clients', '/results']),
+    'orphans': (run_orphans, ['/clients', '/results']),
+    'purge': (run_purge, ['/results']),
+}
+
+
+def plan(commands):
+    '''
+    Returns the steps to run, neighbouring /results reports merged into
+    one step, and how many steps use each collection
+    '''
+    steps = []
+    for args in commands:
+        if args.command in REPORT_BUILDERS:
+            if steps and steps[-1][0] is run_result_reports:
+                steps[-1][2].append(args)
+            else:
+                steps.append((run_result_reports, ['/results'], [args]))
+        else:
+            run, endpoints = COMMANDS[args.command]
+            steps.append((run, endpoints, args))
+    uses = {}
+    for _, endpoints, _ in steps:
+        for endpoint in endpoints:
+            uses[endpoint] = uses.get(endpoint, 0) + 1
+    return steps, uses
+
+
+# Gather our code in a main() function
+def main(args, commands, loglevel):
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=loglevel)
+
+    sensu_hosts = [x.strip() for x in args.sensu_hosts.split(',')]
+    api = sensu_api(args)
+
+    steps, uses = plan(commands)
+    session = Session(api, sensu_hosts, args, uses)
+    label = len(commands) > 1
+    ok = True
+    for run, _, command_args in steps:
+        ok = run(session, command_args, label) and ok
+    api.log_stats()
+    if session.failed or not ok:
+        sys.exit(1)
+
+
+def add_command_parsers(parser):
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    stale = commands.add_parser('stale', help="checks that stopped running")
+    add_stale_arguments(stale)
+    commands.add_parser('no-ttl', help="checks without a TTL")
+    dup = commands.add_parser(
+        'dup', help="clients running per-client checks they also originate")
+    dup.add_argument(
+        "--counts",
+        help="show per client and per Sensu host counts",
+        action="store_true",
+        default=False
+    )
+    for name, description in [
+            ('find', "clients running the given checks"),
+            ('purge', "delete the given checks' results")]:
+        command = commands.add_parser(name, help=description)
+        command.add_argument(
+            "-c",
+            "--check_names",
+            type=str,
+            required=False,
+            help="Comma separated check names",
+            metavar="check_names"
+        )
+        command.add_argument(
+            "-p",
+            "--check_prefixes",
+            type=str,
+            required=False,
+            help="Comma separated per-client check prefixes, e.g. "
+                 "CPU_Metrics_on_ matches CPU_Metrics_on_<client>",
+            metavar="check_prefixes"
+        )
+        if name == 'purge':
+            command.add_argument(
+                "-r",
+                "--rules",
+                type=str,
+                required=False,
+                help="JSON or YAML purge rule file, see sensu_rules.py",
+                metavar="rules"
+            )
+            command.add_argument(
+                "-n",
+                "--dry_run",
+                help="only list the results that would be deleted",
+                action="store_true",
+                default=False
+            )
+    commands.add_parser('clients', help="list the Sensu clients")
+    versions = commands.add_parser('versions',
+                                   help="Sensu client versions")
+    versions.add_argument(
+        "-a",
+        "--aggregate",
+        help="only count clients per version and Sensu host",
+        action="store_true",
+        default=False
+    )
+    versions.add_argument(
+        "-t",
+        "--target_version",
+        "--target-version",
+        type=str,
+        required=False,
+        help="Only include clients running a version older than this one",
+        metavar="target_version"
+    )
+    versions.add_argument(
+        "-b",
+        "--batch_size",
+        type=positive_int,
+        required=False,
+        help="Split the listed clients into upgrade batches of this size",
+        metavar="batch_size"
+    )
+    missing = commands.add_parser(
+        'missing', help="clients without a result for a check")
+    missing.add_argument(
+        "-c",
+        "--check_name",
+        type=str,
+        required=False,
+        help="Check every client is expected to run",
+        metavar="check_name",
+        default="Check_Collectd_Process"
+    )
+    orphans = commands.add_parser(
+        'orphans', help="results of clients that no longer exist")
+    add_orphan_arguments(orphans)
+
+
+def parse_commands(parser, common, argv):
+    '''
+    Options shared by every command may appear anywhere, the rest of
+    the command line is split on "+" and parsed one command at a time
+    '''
+    args, rest = common.parse_known_args(argv)
+    segments = [[]]
+    for value in rest:
+        if value == '+':
+            segments.append([])
+        else:
+            segments[-1].append(value)
+    commands = []
+    for segment in segments:
+        if not segment:
+            parser.error("expected a command")
+        command = parser.parse_args(segment)
+        if command.command is None:
+            parser.error("expected a command")
+        for key, value in vars(args).items():
+            setattr(command, key, value)
+        commands.append(command)
+    if not args.sensu_hosts:
+        parser.error("argument -s/--sensu_hosts is required")
+    if len(commands) > 1 and args.format in DELIMITED_FORMATS:
+        parser.error("the %s format holds a single command, use -f jsonl "
+                     "to run several" % args.format)
+    return args, commands
+
+
+# Standard boilerplate to call the main() function to begin
+# the program.
+if __name__ == '__main__':
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "-s",
+        "--sensu_hosts",
+        type=str,
+        required=False,
+        help="Sensu Host",
+        metavar="sensu_host"
+    )
+    common.add_argument(
+        "--columnar",
+        help="load each host's results into a compact columnar store "
+             "before running the reports",
+        action="store_true",
+        default=False
+    )
+    add_output_arguments(common)
+    add_api_arguments(common)
+    add_delete_arguments(common)
+    loglevel_group = common.add_mutually_exclusive_group(required=False)
+    loglevel_group.add_argument(
+        "-v",
+        "--verbose",
+        help="increase output verbosity",
+        action="count",
+        default=0)
+    loglevel_group.add_argument(
+        "-q",
+        "--quiet",
+        help="decrease output verbosity",
+        action="count",
+        default=0)
+    parser = argparse.ArgumentParser(
+        description="Runs Sensu reports and purges, several commands "
+                    "separated by + share one download.",
+        epilog="Example: sensu_tool.py -s sensu1 stale -t 3600 + no-ttl",
+        parents=[common]
+    )
+    add_command_parsers(parser)
+    args, commands = parse_commands(parser, common, sys.argv[1:])
+
+    # Setup logging
+    # script -vv -> DEBUG
+    # script -v -> INFO
+    # script -> WARNING
+    # script -q -> ERROR
+    # script -qq -> CRITICAL
+    # script -qqq -> no logging at all
+    loglevel = logging.WARNING + 10*args.quiet - 10*args.verbose
+    # Set 'max'/'min' levels for logging
+    if loglevel > 50:
+        loglevel = 50
+    elif loglevel < 10:
+        loglevel = 10
+
+    main(args, commands, loglevel)
@@ -0,0 +1,59 @@
+import json
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sensu_functions import iter_json_array  # noqa: E402
+
+DOCUMENTS = [
+    '[1.5e10, true, null]',
+    '[0, -1, 1.5, -2.25E-3, 7e+2, 123456789, false, "1.5e10"]',
+    '[{"client": "web01", "check": {"name": "keepalive", '
+    '"executed": 1.5e9, "status": 0}}, {"a": [1, {"b": null}], '
+    '"c": "x,]"}, [], {}, [1.0e2, [true]], 3]',
+    ' [ 1 ,\n2.0 ,\t{"x": -0.5} ] ',
+    '[]',
+]
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class IterJSONArrayTest(unittest.TestCase):
+
+    def test_chunk_boundaries(self):
+        for document in DOCUMENTS:
+            expected = json.loads(document)
+            for size in range(1, len(document) + 1):
+                self.assertEqual(
+                    list(iter_json_array(chunked(document, size))),
+                    expected, "%r in chunks of %s" % (document, size))
+
+    def test_random_chunks(self):
+        rand = random.Random(0)
+        for document in DOCUMENTS:
+            expected = json.loads(document)
+            for _ in range(50):
+                chunks = []
+                pos = 0
+                while pos < len(document):
+                    size = 1 + int(rand.random() * 5)
+                    chunks.append(document[pos:pos + size])
+                    pos += size
+                self.assertEqual(list(iter_json_array(chunks)), expected,
+                                 "%r in chunks %r" % (document, chunks))
+
+    def test_truncated(self):
+        for document in DOCUMENTS:
+            text = document.rstrip()[:-1]
+            for size in (1, 3):
+                with self.assertRaises(ValueError):
+                    list(iter_json_array(chunked(text, size)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sensu_rules import PurgeRule, RuleSet  # noqa: E402
+
+
+class RuleSetRegexTest(unittest.TestCase):
+
+    def match(self, rules, check_name):
+        return RuleSet(rules).match('web01', {'name': check_name}, now=1)
+
+    def test_backreferences_survive_several_patterns(self):
+        rule = PurgeRule('twice', regexes=[r'(x)\1', r'(y)\1'])
+        self.assertIs(self.match([rule], 'yy'), rule)
+        self.assertIs(self.match([rule], 'xx'), rule)
+        self.assertIsNone(self.match([rule], 'xy'))
+
+    def test_backreferences_across_rules(self):
+        first = PurgeRule('first', regexes=[r'^(a)\1'])
+        second = PurgeRule('second', regexes=[r'^(b)\1'])
+        self.assertIs(self.match([first, second], 'bb_check'), second)
+
+    def test_patterns_without_groups_are_joined(self):
+        first = PurgeRule('first', regexes=['^cpu_', 'disk$'])
+        second = PurgeRule('second', regexes=['^mem'])
+        rules = RuleSet([first, second])
+        self.assertIsNotNone(rules.regex)
+        self.assertIs(rules.match('web01', {'name': 'mem_used'}, now=1),
+                      second)
+        self.assertIsNone(rules.match('web01', {'name': 'load'}, now=1))
+
+
+if __name__ == '__main__':
+    unittest.main()